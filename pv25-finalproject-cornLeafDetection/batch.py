@@ -0,0 +1,281 @@
+"""Headless batch classification for the corn leaf detector.
+
+Usage:
+    python batch.py "gambar Tes" --model COLOR_RF
+    python batch.py "photos/**/*.jpg" --workers 8 --db corn.db
+    python batch.py --jobs
+    python batch.py --resume 3
+
+Every run is recorded as a job in the database, with one item per input
+file, so a run that was killed can be resumed with --resume.
+"""
+import os
+import sys
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import features
+import models
+import database
+from engine import PredictionEngine, Prediction, BACKENDS
+
+ETA_WINDOW_SECONDS = 60
+PROGRESS_INTERVAL_SECONDS = 5
+
+_worker_engine = None
+_worker_model_name = None
+
+
+def _initWorker(model_name_prefix, model_directory, backend, feature_db_path, history_db_path, near_radius,
+                min_vegetation):
+    """Load the model(s) and open the feature store and history once per worker process"""
+    global _worker_engine, _worker_model_name
+    feature_store = database.FeatureStore(feature_db_path) if feature_db_path else None
+    history = database.PredictionHistory(history_db_path) if history_db_path else None
+    _worker_engine = PredictionEngine(model_directory, backend, feature_store, history, near_radius, min_vegetation)
+    for name, error in _worker_engine.loadAvailable(models.memberNames(model_name_prefix)).items():
+        print(f"Error loading {name}: {error}", file=sys.stderr)
+    _worker_model_name = model_name_prefix
+
+
+def _classifyChunk(image_paths):
+    """Classify a chunk of images inside a worker with one predict_batch call"""
+    try:
+        return _worker_engine.predict_batch(image_paths, _worker_model_name)
+    except Exception as e:
+        return [Prediction(image_path, None, None, None, str(e)) for image_path in image_paths]
+
+
+class ThroughputEstimate:
+    """Images per second over the last window seconds, for a stable ETA"""
+
+    def __init__(self, window=ETA_WINDOW_SECONDS):
+        self.window = window
+        self.samples = deque()
+
+    def add(self, finished, now=None):
+        """Record the number of items finished so far"""
+        now = time.perf_counter() if now is None else now
+        self.samples.append((now, finished))
+        while len(self.samples) > 2 and now - self.samples[1][0] >= self.window:
+            self.samples.popleft()
+
+    def rate(self):
+        if len(self.samples) < 2:
+            return 0.0
+        (start, first), (end, last) = self.samples[0], self.samples[-1]
+        return (last - first) / (end - start) if end > start else 0.0
+
+    def eta(self, remaining):
+        """Seconds until remaining more items are finished, or None before there is a rate"""
+        rate = self.rate()
+        return remaining / rate if rate > 0 else None
+
+
+def formatDuration(seconds):
+    if seconds is None:
+        return '?'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02d}:{seconds:02d}'
+
+
+def createBatchJob(image_paths, model_name_prefix, db_path=database.DB_PATH, backend='sklearn', feature_store=True,
+                   reuse_results=True, near_radius=0, min_vegetation=features.PREFILTER_MIN_COVERAGE):
+    """Record a job for image_paths in db_path and return its id"""
+    options = {
+        'backend': backend,
+        'feature_store': feature_store,
+        'reuse_results': reuse_results,
+        'near_radius': near_radius,
+        'min_vegetation': min_vegetation
+    }
+    conn = database.connect(db_path)
+    try:
+        return database.createJob(conn, image_paths, model_name_prefix, options)
+    finally:
+        conn.close()
+
+
+def runJob(job_id, db_path=database.DB_PATH, model_directory=models.MODEL_DIRECTORY, workers=None, batch_size=32,
+           commit_every=500, report_every=PROGRESS_INTERVAL_SECONDS):
+    """Classify the unfinished items of a job across a process pool
+
+    Items are claimed in chunks of batch_size and their prediction rows are
+    committed together with the item status, at least every commit_every
+    rows. Items a killed run had claimed but not committed go back to
+    pending first, so a resumed job continues exactly where the last commit
+    left it. Progress with an ETA from the rolling throughput is printed
+    every report_every seconds (None: never). Returns (done, failed, reused,
+    elapsed) for this run.
+    """
+    conn = database.connect(db_path)
+    job = database.loadJob(conn, job_id)
+    if job is None:
+        conn.close()
+        raise ValueError(f"Job {job_id} not found in {db_path}")
+    model_name_prefix, options, _ = job
+
+    database.releaseClaims(conn, job_id)
+    counts = database.jobCounts(conn, job_id)
+    total = sum(counts.values())
+    finished = counts.get('done', 0) + counts.get('failed', 0)
+    remaining = counts.get('pending', 0)
+
+    workers = workers or os.cpu_count() or 1
+    batch_size = max(1, min(batch_size, -(-remaining // workers)))
+    throughput = ThroughputEstimate()
+    throughput.add(finished)
+    last_report = time.perf_counter()
+    reported = finished
+
+    results = []
+    done = 0
+    failed = 0
+    reused = 0
+
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker,
+                             initargs=(model_name_prefix, model_directory, options['backend'],
+                                       db_path if options['feature_store'] else None,
+                                       db_path if options['reuse_results'] else None, options['near_radius'],
+                                       options['min_vegetation'])) as executor:
+        in_flight = {}
+
+        def submit():
+            items = database.claimJobItems(conn, job_id, batch_size)
+            if items:
+                in_flight[executor.submit(_classifyChunk, [path for _, path in items])] = items
+            return bool(items)
+
+        while len(in_flight) < 2 * workers and submit():
+            pass
+
+        while in_flight:
+            completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in completed:
+                items = in_flight.pop(future)
+                for (item_id, _), prediction in zip(items, future.result()):
+                    if prediction.error is not None:
+                        failed += 1
+                        print(f"Error classifying {prediction.image_path}: {prediction.error}", file=sys.stderr)
+                        results.append((item_id, None, prediction.content_hash, prediction.error))
+                        continue
+
+                    results.append((item_id, database.predictionRow(prediction, model_name_prefix),
+                                    prediction.content_hash, None))
+                    done += 1
+                    reused += prediction.cached
+                submit()
+
+            if len(results) >= commit_every or not in_flight:
+                database.completeJobItems(conn, results)
+                finished += len(results)
+                throughput.add(finished)
+                results = []
+
+            if report_every is not None and finished > reported and \
+                    time.perf_counter() - last_report >= report_every:
+                last_report = time.perf_counter()
+                reported = finished
+                print(f"Job {job_id}: {finished}/{total} committed, {throughput.rate():.1f} images/sec, "
+                      f"ETA {formatDuration(throughput.eta(total - finished))}")
+
+    if database.jobCounts(conn, job_id).keys() <= {'done', 'failed'}:
+        database.finishJob(conn, job_id)
+    conn.close()
+
+    elapsed = time.perf_counter() - start_time
+    return done, failed, reused, elapsed
+
+
+def runBatch(image_paths, model_name_prefix, db_path=database.DB_PATH,
+             model_directory=models.MODEL_DIRECTORY, workers=None, batch_size=32, commit_every=500,
+             backend='sklearn', feature_store=True, reuse_results=True, near_radius=0,
+             min_vegetation=features.PREFILTER_MIN_COVERAGE):
+    """Classify images across a process pool as a new job and bulk-insert the results
+
+    With feature_store the workers reuse feature vectors cached in db_path,
+    with reuse_results they return earlier results for byte-identical images
+    and, if near_radius > 0, for images whose perceptual hash differs by at
+    most near_radius bits from an earlier one. Images with less vegetation
+    coverage than min_vegetation are answered as non-leaf without a model.
+    """
+    job_id = createBatchJob(image_paths, model_name_prefix, db_path, backend, feature_store, reuse_results,
+                            near_radius, min_vegetation)
+    return runJob(job_id, db_path, model_directory, workers, batch_size, commit_every, report_every=None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Classify corn leaf images without the GUI.')
+    parser.add_argument('inputs', nargs='*', help='image directories or glob patterns')
+    parser.add_argument('--resume', type=int, metavar='JOB', help='continue an interrupted job instead of starting one')
+    parser.add_argument('--jobs', action='store_true', help='list the jobs in the database and exit')
+    parser.add_argument('--model', default='COLOR_RF',
+                        choices=models.MODEL_NAMES + [models.ENSEMBLE_NAME, models.CASCADE_NAME])
+    parser.add_argument('--db', default=database.DB_PATH, help='SQLite database (default: corn.db)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes (default: CPU count)')
+    parser.add_argument('--backend', default='sklearn', choices=BACKENDS, help='forest inference backend')
+    parser.add_argument('--batch-size', type=int, default=32, help='images per predict_batch call')
+    parser.add_argument('--commit-every', type=int, default=500, help='rows per insert transaction')
+    parser.add_argument('--report-every', type=float, default=PROGRESS_INTERVAL_SECONDS,
+                        help='seconds between progress lines')
+    parser.add_argument('--no-feature-store', action='store_true', help='always extract features from the pixels')
+    parser.add_argument('--rescore', action='store_true', help='classify images even if identical files were classified before')
+    parser.add_argument('--near-radius', type=int, default=0,
+                        help='reuse the result of an earlier image whose perceptual hash differs by at most this '
+                             'many bits of 64 (default 0: off)')
+    parser.add_argument('--min-vegetation', type=float, default=features.PREFILTER_MIN_COVERAGE,
+                        help='answer "Bukan Daun Jagung" without a model below this leaf-coloured share of the '
+                             f'image (default {features.PREFILTER_MIN_COVERAGE}, 0: off)')
+    args = parser.parse_args(argv)
+
+    if args.jobs:
+        conn = database.connect(args.db)
+        print(f"{'job':>5} {'model':<12} {'status':<8} {'created':<19} {'items':>15}")
+        for job_id, model_used, status, created_date, finished, total in database.listJobs(conn):
+            print(f"{job_id:>5} {model_used:<12} {status:<8} {created_date:<19} {finished or 0:>7}/{total:<7}")
+        conn.close()
+        return 0
+
+    if args.resume is not None:
+        conn = database.connect(args.db)
+        job = database.loadJob(conn, args.resume)
+        conn.close()
+        if job is None:
+            parser.error(f"job {args.resume} not found in {args.db}")
+        model_name_prefix = job[0]
+        job_id = args.resume
+    else:
+        if not args.inputs:
+            parser.error('give image inputs, --resume JOB or --jobs')
+        model_name_prefix = args.model
+
+    if not any(os.path.exists(models.modelPath(name)) for name in models.memberNames(model_name_prefix)):
+        parser.error(f"model file not found for {model_name_prefix} in {models.MODEL_DIRECTORY}")
+
+    if args.resume is None:
+        image_paths = features.collectImages(args.inputs)
+        if not image_paths:
+            print('No images found.')
+            return 1
+        job_id = createBatchJob(image_paths, args.model, args.db, args.backend,
+                                feature_store=not args.no_feature_store, reuse_results=not args.rescore,
+                                near_radius=args.near_radius, min_vegetation=args.min_vegetation)
+        print(f"Job {job_id}: classifying {len(image_paths)} images with {args.model} on {args.workers} workers...")
+    else:
+        print(f"Resuming job {job_id} with {model_name_prefix} on {args.workers} workers...")
+
+    done, failed, reused, elapsed = runJob(job_id, args.db, workers=args.workers, batch_size=args.batch_size,
+                                           commit_every=args.commit_every, report_every=args.report_every)
+
+    throughput = done / elapsed if elapsed > 0 else 0.0
+    print(f"Done: {done} classified ({reused} from earlier results), {failed} failed "
+          f"in {elapsed:.2f} s ({throughput:.1f} images/sec)")
+    return 0 if failed == 0 else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
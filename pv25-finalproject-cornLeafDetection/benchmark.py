@@ -0,0 +1,322 @@
+"""Performance checks for the corn leaf detector.
+
+Usage:
+    python benchmark.py forest ["gambar Tes"]
+    python benchmark.py glcm ["gambar Tes"] [--batch 64]
+    python benchmark.py lbp ["gambar Tes"] [--batch 64]
+    python benchmark.py color ["gambar Tes"]
+    python benchmark.py prefilter ["gambar Tes"]
+    python benchmark.py decode ["gambar Tes"]
+    python benchmark.py db [--repeat 200]
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import tracemalloc
+import cv2
+import numpy as np
+from skimage.feature import graycomatrix, graycoprops, local_binary_pattern
+
+import features
+import models
+import forest
+import database
+
+TEST_IMAGE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gambar Tes')
+
+
+def timeit(function, repeat):
+    """Return the mean wall time of function() in milliseconds after one warm-up call"""
+    function()
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start_time) / repeat * 1000
+
+
+def benchmarkForest(image_paths, repeat):
+    """Compare single-row and batch latency of sklearn and the compiled forest"""
+    print(f"{'model':<10} {'rows':>5} {'sklearn ms':>11} {'compiled ms':>12} {'speedup':>8}  identical")
+    for model_name_prefix in models.MODEL_NAMES:
+        if not os.path.exists(models.modelPath(model_name_prefix)):
+            print(f"{model_name_prefix:<10} model file not found")
+            continue
+
+        model = models.loadModel(model_name_prefix)
+        compiled = forest.compileForest(model)
+        feature_method_type = models.featureMethod(model_name_prefix)
+        X = np.vstack([features.extractFeatures(path, feature_method_type, cache=None) for path in image_paths])
+
+        for rows in (X[:1], X):
+            sklearn_ms = timeit(lambda: model.predict_proba(rows), repeat)
+            compiled_ms = timeit(lambda: compiled.predict_proba(rows), repeat)
+            identical = np.array_equal(model.predict_proba(rows), compiled.predict_proba(rows))
+            print(f"{model_name_prefix:<10} {len(rows):>5} {sklearn_ms:>11.3f} {compiled_ms:>12.3f} "
+                  f"{sklearn_ms / compiled_ms:>7.1f}x  {identical}")
+
+
+def skimageGLCM(gray_uint8):
+    """The per-image skimage GLCM path used before extractGLCMBatch"""
+    glcm = graycomatrix(gray_uint8, distances=[1], angles=[0], symmetric=True, normed=True)
+    return [graycoprops(glcm, prop)[0, 0] for prop in ('contrast', 'correlation', 'energy', 'homogeneity')]
+
+
+def imageStack(image_paths, batch):
+    """Preprocess the images and repeat them up to a stack of batch images"""
+    images = [features.preprocessImage(path) for path in image_paths]
+    return [images[i % len(images)] for i in range(batch)]
+
+
+def benchmarkGLCM(image_paths, batch, repeat):
+    """Compare per-image skimage GLCM with the batched bincount implementation"""
+    images = imageStack(image_paths, batch)
+    stack = np.stack([image.gray for image in images])
+
+    skimage_ms = timeit(lambda: [skimageGLCM(gray) for gray in stack], repeat)
+    batch_ms = timeit(lambda: features.extractGLCMBatch(stack), repeat)
+
+    expected = np.array([skimageGLCM(gray) for gray in stack])
+    actual = features.extractGLCMBatch(stack)
+    max_error = np.max(np.abs(actual - expected) / np.maximum(np.abs(expected), 1e-12))
+
+    print(f"{batch} images of {stack.shape[1]}x{stack.shape[2]}")
+    print(f"skimage per image: {skimage_ms:9.2f} ms  ({batch / skimage_ms * 1000:8.1f} images/sec)")
+    print(f"batched bincount:  {batch_ms:9.2f} ms  ({batch / batch_ms * 1000:8.1f} images/sec)")
+    print(f"speedup {skimage_ms / batch_ms:.1f}x, max relative difference {max_error:.2e}")
+
+
+def skimageLBP(gray_img_float):
+    """The per-image skimage LBP path used before extractLBPBatch"""
+    lbp = local_binary_pattern(gray_img_float, features.LBP_POINTS, features.LBP_RADIUS, method='uniform')
+    hist, _ = np.histogram(lbp.ravel(), bins=np.arange(0, features.LBP_POINTS + 3),
+                           range=(0, features.LBP_POINTS + 2))
+    return hist / (hist.sum() + 1e-6)
+
+
+def benchmarkLBP(image_paths, batch, repeat):
+    """Compare per-image skimage LBP with the batched shifted-array implementation"""
+    stack = np.stack([image.gray for image in imageStack(image_paths, batch)])
+    float_stack = stack.astype(np.float32) / 255.0
+
+    skimage_ms = timeit(lambda: [skimageLBP(gray) for gray in float_stack], repeat)
+    batch_ms = timeit(lambda: features.extractLBPBatch(stack), repeat)
+
+    expected = np.array([skimageLBP(gray) for gray in float_stack])
+    identical = np.array_equal(features.extractLBPBatch(stack), expected)
+
+    print(f"{batch} images of {stack.shape[1]}x{stack.shape[2]}")
+    print(f"skimage per image: {skimage_ms:9.2f} ms  ({batch / skimage_ms * 1000:8.1f} images/sec)")
+    print(f"batched lookup:    {batch_ms:9.2f} ms  ({batch / batch_ms * 1000:8.1f} images/sec)")
+    print(f"speedup {skimage_ms / batch_ms:.1f}x, identical histograms: {identical}")
+
+
+def floatColorFeatures(image):
+    """The float32 round-trip COLOR path used before the uint8 pipeline"""
+    image_resized = cv2.resize(image, features.IMAGE_SIZE)
+    image_rgb_float = cv2.cvtColor(image_resized, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0
+    image_gray_float = cv2.cvtColor(image_resized, cv2.COLOR_BGR2GRAY).astype(np.float32) / 255.0
+
+    feature_values = []
+    for chan in cv2.split((image_rgb_float * 255).astype(np.uint8)):
+        hist = cv2.calcHist([chan], [0], None, [256], [0, 256]).flatten()
+        feature_values.extend(hist / (hist.sum() + 1e-6))
+    return np.array(feature_values).reshape(1, -1)
+
+
+def uint8ColorFeatures(image, out):
+    """The current COLOR path: resize, then histograms straight into a feature row"""
+    return features.extractColor(features.PreprocessedImage(cv2.resize(image, features.IMAGE_SIZE)).bgr, out)
+
+
+def peakAllocation(function):
+    """Return the peak number of bytes in use while function() runs"""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmarkColor(image_paths, repeat):
+    """Compare per-image time and allocations of the float and uint8 COLOR paths after decoding"""
+    decoded = [cv2.imread(path) for path in image_paths]
+    out = np.empty((len(decoded), features.FEATURE_SIZES['COLOR']), dtype=np.float32)
+
+    def uint8Path():
+        for row, image in enumerate(decoded):
+            uint8ColorFeatures(image, out[row])
+
+    float_ms = timeit(lambda: [floatColorFeatures(image) for image in decoded], repeat) / len(decoded)
+    uint8_ms = timeit(uint8Path, repeat) / len(decoded)
+    float_peak = max(peakAllocation(lambda: floatColorFeatures(image)) for image in decoded)
+    uint8_peak = max(peakAllocation(lambda: uint8ColorFeatures(image, out[0])) for image in decoded)
+
+    expected = np.vstack([floatColorFeatures(image) for image in decoded])
+    uint8Path()
+    identical = np.array_equal(out, expected)
+
+    print(f"{len(decoded)} images, per image from the decoded file (resize + features)")
+    print(f"float32 round trip: {float_ms:8.3f} ms  {float_peak / 1024:8.1f} KiB peak")
+    print(f"uint8 in place:     {uint8_ms:8.3f} ms  {uint8_peak / 1024:8.1f} KiB peak")
+    print(f"{float_ms / uint8_ms:.1f}x faster, {float_peak / uint8_peak:.1f}x less memory, "
+          f"identical features: {identical}")
+
+
+def benchmarkPrefilter(image_paths, repeat):
+    """Time the vegetation gate and count how many leaves it would reject
+
+    Test images whose file name starts with 'daun' are leaves, the others
+    (sky, hands, screenshots) are not.
+    """
+    images = [features.preprocessImage(path) for path in image_paths]
+    threshold = features.PREFILTER_MIN_COVERAGE
+
+    print(f"{'image':<20} {'coverage':>9}  {'expected':<8} gate")
+    false_rejects = 0
+    true_rejects = 0
+    leaves = 0
+    for path, image in zip(image_paths, images):
+        coverage = features.vegetationCoverage(image.bgr)
+        is_leaf = os.path.basename(path).lower().startswith('daun')
+        rejected = coverage < threshold
+        leaves += is_leaf
+        false_rejects += is_leaf and rejected
+        true_rejects += not is_leaf and rejected
+        print(f"{os.path.basename(path):<20} {coverage:>9.3f}  {'leaf' if is_leaf else 'other':<8} "
+              f"{'reject' if rejected else 'pass'}")
+
+    gate_us = timeit(lambda: [features.vegetationCoverage(image.bgr) for image in images], repeat) / len(images) * 1000
+    others = len(images) - leaves
+    print(f"threshold {threshold}: {false_rejects}/{leaves} leaves rejected, "
+          f"{true_rejects}/{others} non-leaves rejected, {gate_us:.1f} us per image")
+
+
+def fullDecode(image_path):
+    """The decode used before reduced JPEG decoding: every pixel, then resize"""
+    return features.PreprocessedImage(cv2.resize(cv2.imread(image_path), features.IMAGE_SIZE))
+
+
+def benchmarkDecode(image_paths, repeat):
+    """Compare full and reduced-resolution decoding: time, feature drift and changed predictions"""
+    print(f"{'image':<20} {'size':>11} {'scale':>5} {'full ms':>8} {'reduced ms':>10}")
+    full_total = 0.0
+    reduced_total = 0.0
+    for path in image_paths:
+        width, height = features.jpegSize(path) or (0, 0)
+        scale = features.decodeScale(path)
+        full_ms = timeit(lambda: fullDecode(path), repeat)
+        reduced_ms = timeit(lambda: features.preprocessImage(path), repeat)
+        full_total += full_ms
+        reduced_total += reduced_ms
+        size = f'{width}x{height}' if width else '-'
+        print(f"{os.path.basename(path):<20} {size:>11} {scale:>5} {full_ms:>8.2f} {reduced_ms:>10.2f}")
+    print(f"total {full_total:.1f} ms full, {reduced_total:.1f} ms reduced ({full_total / reduced_total:.1f}x)")
+
+    full = [fullDecode(path) for path in image_paths]
+    reduced = [features.preprocessImage(path) for path in image_paths]
+    for method in features.FEATURE_METHODS:
+        X_full = features.featureMatrix(full, method)
+        X_reduced = features.featureMatrix(reduced, method)
+        drift = np.abs(X_reduced - X_full).sum(axis=1) / np.maximum(np.abs(X_full).sum(axis=1), 1e-12)
+        line = f"{method:<6} feature drift (relative L1) mean {drift.mean():.3f}, max {drift.max():.3f}"
+
+        model_name_prefix = f'{method}_RF'
+        if os.path.exists(models.modelPath(model_name_prefix)):
+            model = models.loadModel(model_name_prefix)
+            changed = int(np.sum(model.predict(X_full) != model.predict(X_reduced)))
+            line += f", {changed}/{len(image_paths)} predictions changed by {model_name_prefix}"
+        print(line)
+
+
+def connectPerWrite(db_path, row):
+    """The write path used before PredictionDatabase: a new rollback-journal connection per row"""
+    conn = sqlite3.connect(db_path)
+    database.insertPredictions(conn, [row])
+    conn.close()
+
+
+def benchmarkDatabase(repeat):
+    """Compare the latency of single-row prediction writes, connect-per-call vs PredictionDatabase"""
+    row = {'filename': 'daun.jpg', 'result': 'Daun Jagung Sakit', 'model_used': 'COLOR_RF', 'confidence': 0.87}
+
+    with tempfile.TemporaryDirectory() as directory:
+        old_path = os.path.join(directory, 'old.db')
+        conn = sqlite3.connect(old_path)
+        database.createTables(conn)
+        conn.close()
+        old_ms = timeit(lambda: connectPerWrite(old_path, row), repeat)
+
+        store = database.PredictionDatabase(os.path.join(directory, 'new.db'))
+        new_ms = timeit(lambda: store.insert([row]), repeat)
+        read_ms = timeit(store.fetchAll, max(1, repeat // 10))
+        store.close()
+
+        full_path = os.path.join(directory, 'full.db')
+        conn = database.connect(full_path)
+        conn.execute('PRAGMA synchronous = FULL')
+        full_ms = timeit(lambda: database.insertPredictions(conn, [row]), repeat)
+        conn.close()
+
+        writer = database.PredictionWriter(os.path.join(directory, 'writer.db'))
+
+        def groupCommit():
+            for _ in range(repeat):
+                writer.submit([row])
+            writer.flush()
+
+        groupCommit()
+        commits = writer.commits
+        start_time = time.perf_counter()
+        groupCommit()
+        writer_ms = (time.perf_counter() - start_time) / repeat * 1000
+        writer_commits = writer.commits - commits
+        writer.close()
+
+    print(f"{repeat} single-row writes")
+    print(f"connect per call, rollback journal: {old_ms:8.3f} ms per write")
+    print(f"PredictionDatabase, {database.JOURNAL_MODE} synchronous={database.SYNCHRONOUS}: "
+          f"{new_ms:8.3f} ms per write ({old_ms / new_ms:.1f}x)")
+    print(f"one commit per row, {database.JOURNAL_MODE} synchronous=FULL: {full_ms:8.3f} ms per write")
+    print(f"PredictionWriter group commit, synchronous=FULL: {writer_ms:8.3f} ms per row "
+          f"({repeat / writer_commits:.1f} rows per commit, {full_ms / writer_ms:.1f}x)")
+    print(f"fetchAll of {repeat + 1} rows: {read_ms:.3f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark parts of the prediction pipeline.')
+    parser.add_argument('bench', choices=['forest', 'glcm', 'lbp', 'color', 'prefilter', 'decode', 'db'])
+    parser.add_argument('inputs', nargs='*', default=[TEST_IMAGE_DIRECTORY], help='image directories or glob patterns')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--batch', type=int, default=64, help='stack size for the feature benchmarks')
+    args = parser.parse_args(argv)
+
+    if args.bench == 'db':
+        benchmarkDatabase(args.repeat)
+        return 0
+
+    image_paths = features.collectImages(args.inputs)
+    if not image_paths:
+        print('No images found.')
+        return 1
+
+    if args.bench == 'forest':
+        benchmarkForest(image_paths, args.repeat)
+    elif args.bench == 'glcm':
+        benchmarkGLCM(image_paths, args.batch, max(1, args.repeat // 10))
+    elif args.bench == 'lbp':
+        benchmarkLBP(image_paths, args.batch, max(1, args.repeat // 10))
+    elif args.bench == 'color':
+        benchmarkColor(image_paths, max(1, args.repeat // 10))
+    elif args.bench == 'prefilter':
+        benchmarkPrefilter(image_paths, args.repeat)
+    elif args.bench == 'decode':
+        benchmarkDecode(image_paths, max(1, args.repeat // 10))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+def hammingDistance(a, b):
+    """Number of differing bits between two integer hashes"""
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes with Hamming distance
+
+    Every child edge is labelled with its distance to the parent, so a
+    search within radius r only follows edges between d - r and d + r and
+    skips most of the tree for small radii.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, key, value):
+        """Insert key with value; an existing identical key gets the new value"""
+        if self.root is None:
+            self.root = [key, value, {}]
+            self.size = 1
+            return
+
+        node = self.root
+        while True:
+            distance = hammingDistance(key, node[0])
+            if distance == 0:
+                node[1] = value
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, value, {}]
+                self.size += 1
+                return
+            node = child
+
+    def search(self, key, radius):
+        """Return (distance, key, value) for every key within radius, nearest first"""
+        if self.root is None:
+            return []
+
+        found = []
+        stack = [self.root]
+        while stack:
+            node_key, value, children = stack.pop()
+            distance = hammingDistance(key, node_key)
+            if distance <= radius:
+                found.append((distance, node_key, value))
+            for edge, child in children.items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        found.sort(key=lambda match: match[0])
+        return found
+
+    def nearest(self, key, radius):
+        """Return the closest (distance, key, value) within radius, or None"""
+        found = self.search(key, radius)
+        return found[0] if found else None
+
+    def __len__(self):
+        return self.size
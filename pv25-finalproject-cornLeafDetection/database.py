@@ -0,0 +1,632 @@
+import os
+import json
+import time
+import queue
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+
+from bktree import BKTree
+
+DB_PATH = 'corn.db'
+FEATURE_STORE_MAX_ROWS = 20000
+FEATURE_STORE_MAX_AGE_DAYS = 30
+# WAL lets readers run next to a writer and, with synchronous=NORMAL, only
+# syncs at checkpoints instead of on every commit. A power cut can lose the
+# last commits but never corrupts the database.
+JOURNAL_MODE = 'WAL'
+SYNCHRONOUS = 'NORMAL'
+STATEMENT_CACHE_SIZE = 64
+WRITER_MAX_ROWS = 256
+WRITER_MAX_DELAY_MS = 50
+HISTORY_COLUMNS = ('id', 'filename', 'result', 'model_used', 'prediction_date', 'confidence')
+FILENAME_INDEX_MIN_SEARCH = 3  # trigram index; shorter searches scan the table
+
+
+def createTables(conn):
+    """Create the predictions and features tables if they do not exist"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS predictions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL,
+            result TEXT NOT NULL,
+            model_used TEXT NOT NULL,
+            prediction_date TEXT NOT NULL,
+            confidence REAL,
+            notes TEXT,
+            content_hash TEXT,
+            phash INTEGER,
+            stage TEXT,
+            area_fractions TEXT,
+            model_version TEXT
+        )
+    ''')
+    columns = [column[1] for column in cursor.execute('PRAGMA table_info(predictions)')]
+    for column, column_type in (('content_hash', 'TEXT'), ('phash', 'INTEGER'), ('stage', 'TEXT'),
+                                ('area_fractions', 'TEXT'), ('model_version', 'TEXT')):
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE predictions ADD COLUMN {column} {column_type}')
+    cursor.execute('CREATE INDEX IF NOT EXISTS predictions_content_hash ON predictions (content_hash, model_used)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS predictions_result ON predictions (result)')
+    _createFilenameIndex(cursor)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS features (
+            content_hash TEXT NOT NULL,
+            method TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            vector BLOB NOT NULL,
+            last_used TEXT NOT NULL,
+            PRIMARY KEY (content_hash, method, version)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS features_last_used ON features (last_used)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            model_used TEXT NOT NULL,
+            options TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_date TEXT NOT NULL,
+            finished_date TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER NOT NULL REFERENCES jobs (id),
+            path TEXT NOT NULL,
+            content_hash TEXT,
+            status TEXT NOT NULL,
+            prediction_id INTEGER,
+            error TEXT,
+            UNIQUE (job_id, path)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS job_items_status ON job_items (job_id, status)')
+    conn.commit()
+
+
+def _createFilenameIndex(cursor):
+    """Keep a trigram FTS5 index of predictions.filename for substring search
+
+    Triggers keep it in step with the predictions table; it is built from
+    the existing rows when first created. Skipped if this SQLite has no
+    trigram tokenizer, in which case searches fall back to LIKE.
+    """
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'predictions_filename'").fetchone() is None:
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE predictions_filename
+                USING fts5 (filename, content='predictions', content_rowid='id', tokenize='trigram')
+            ''')
+        except sqlite3.OperationalError:
+            return
+        cursor.execute("INSERT INTO predictions_filename (predictions_filename) VALUES ('rebuild')")
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS predictions_filename_insert AFTER INSERT ON predictions BEGIN
+            INSERT INTO predictions_filename (rowid, filename) VALUES (new.id, new.filename);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS predictions_filename_delete AFTER DELETE ON predictions BEGIN
+            INSERT INTO predictions_filename (predictions_filename, rowid, filename)
+            VALUES ('delete', old.id, old.filename);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS predictions_filename_update AFTER UPDATE OF filename ON predictions BEGIN
+            INSERT INTO predictions_filename (predictions_filename, rowid, filename)
+            VALUES ('delete', old.id, old.filename);
+            INSERT INTO predictions_filename (rowid, filename) VALUES (new.id, new.filename);
+        END
+    ''')
+
+
+def timestamp(when=None):
+    """Return the current time (or when) in the format stored in prediction_date"""
+    return (when or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def toSigned64(value):
+    """Store an unsigned 64-bit hash in an SQLite INTEGER"""
+    return None if value is None else value - (1 << 64) if value >= 1 << 63 else value
+
+
+def fromSigned64(value):
+    return None if value is None else value & ((1 << 64) - 1)
+
+
+# Rows a model answered itself; PREFILTER (models.PREFILTER_STAGE) rows are not model results
+REUSABLE_PREDICTION = "IFNULL(stage, '') != 'PREFILTER'"
+
+INSERT_PREDICTION = '''
+    INSERT INTO predictions (filename, result, model_used, prediction_date, confidence, notes,
+                             content_hash, phash, stage, area_fractions, model_version)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def _historyQuery(search='', result=None, filename_index=False):
+    """SELECT of the prediction ids matching a filename substring and an exact result text
+
+    The statement takes the id to page after and the page size as its
+    first and last parameters. Searches of FILENAME_INDEX_MIN_SEARCH
+    characters or more go through the trigram index, which returns its
+    matches in id order, so a page stops reading at its last match.
+    """
+    if search and filename_index and len(search) >= FILENAME_INDEX_MIN_SEARCH:
+        key = 'f.rowid'
+        source = 'predictions_filename f JOIN predictions p ON p.id = f.rowid'
+        conditions = ['predictions_filename MATCH ?']
+        params = ['"' + search.replace('"', '""') + '"']
+    else:
+        key = 'p.id'
+        source = 'predictions p'
+        conditions = []
+        params = []
+        if search:
+            escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append("p.filename LIKE ? ESCAPE '\\'")
+            params.append(f'%{escaped}%')
+    if result is not None:
+        conditions.append('p.result = ?')
+        params.append(result)
+    where = ''.join(f' AND {condition}' for condition in conditions)
+    return f'SELECT {key} FROM {source} WHERE {key} > ?{where} ORDER BY {key} LIMIT ?', params
+
+
+def _predictionValues(row, prediction_date):
+    return (row['filename'], row['result'], row['model_used'], prediction_date, row['confidence'],
+            row.get('notes', ''), row.get('content_hash'), toSigned64(row.get('phash')), row.get('stage'),
+            json.dumps(row['area_fractions']) if row.get('area_fractions') else None, row.get('model_version'))
+
+
+def insertPredictions(conn, rows):
+    """Insert many prediction rows in one transaction
+
+    Each row is a dict with filename, result, model_used and confidence, and
+    optionally notes, content_hash, phash (unsigned 64-bit), stage (the
+    cascade model or PREFILTER that answered), area_fractions
+    ({class name: share of the image} for tiled predictions, stored as JSON)
+    and model_version (PredictionEngine.modelVersion, the reuse key).
+    Returns the ids of the new rows.
+    """
+    prediction_date = timestamp()
+    with conn:
+        return [conn.execute(INSERT_PREDICTION, _predictionValues(row, prediction_date)).lastrowid for row in rows]
+
+
+def reuseNote(prediction):
+    """The notes value recording where a reused result came from"""
+    if not prediction.cached:
+        return ''
+    if prediction.distance:
+        return f'near-duplicate ({prediction.distance} bit)'
+    return 'cached'
+
+
+def predictionRow(prediction, model_name_prefix, notes=None):
+    """The insertPredictions row of a PredictionEngine Prediction
+
+    notes defaults to reuseNote(prediction). Reused results are saved
+    without a phash so they never enter the near-duplicate index (see
+    PredictionHistory).
+    """
+    return {
+        'filename': os.path.basename(prediction.image_path),
+        'result': prediction.result,
+        'model_used': model_name_prefix,
+        'confidence': prediction.confidence,
+        'content_hash': prediction.content_hash,
+        'phash': None if prediction.cached else prediction.phash,
+        'stage': prediction.stage,
+        'model_version': prediction.model_version,
+        'notes': reuseNote(prediction) if notes is None else notes
+    }
+
+
+def createJob(conn, image_paths, model_name_prefix, options):
+    """Record a batch job and one pending item per input path; returns the job id
+
+    options is a dict of the runBatch settings, kept so a resumed job runs
+    the same way.
+    """
+    with conn:
+        cursor = conn.execute('INSERT INTO jobs (model_used, options, status, created_date) VALUES (?, ?, ?, ?)',
+                              (model_name_prefix, json.dumps(options), 'running', timestamp()))
+        job_id = cursor.lastrowid
+        conn.executemany("INSERT OR IGNORE INTO job_items (job_id, path, status) VALUES (?, ?, 'pending')",
+                         [(job_id, image_path) for image_path in image_paths])
+    return job_id
+
+
+def loadJob(conn, job_id):
+    """Return (model_used, options, status) of a job, or None if it does not exist"""
+    row = conn.execute('SELECT model_used, options, status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return None if row is None else (row[0], json.loads(row[1]), row[2])
+
+
+def jobCounts(conn, job_id):
+    """Return {status: number of items} for a job"""
+    return dict(conn.execute('SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status', (job_id,)))
+
+
+def listJobs(conn):
+    """Return (id, model_used, status, created_date, done items, total items) for every job, newest first"""
+    return conn.execute('''
+        SELECT jobs.id, jobs.model_used, jobs.status, jobs.created_date,
+               SUM(job_items.status IN ('done', 'failed')), COUNT(job_items.id)
+        FROM jobs LEFT JOIN job_items ON job_items.job_id = jobs.id
+        GROUP BY jobs.id ORDER BY jobs.id DESC
+    ''').fetchall()
+
+
+def releaseClaims(conn, job_id):
+    """Put items claimed by a run that never finished them back to pending"""
+    with conn:
+        return conn.execute("UPDATE job_items SET status = 'pending' WHERE job_id = ? AND status = 'claimed'",
+                            (job_id,)).rowcount
+
+
+def claimJobItems(conn, job_id, limit):
+    """Mark up to limit pending items as claimed and return them as (item id, path), in input order"""
+    with conn:
+        rows = conn.execute('''
+            UPDATE job_items SET status = 'claimed'
+            WHERE id IN (SELECT id FROM job_items WHERE job_id = ? AND status = 'pending' ORDER BY id LIMIT ?)
+            RETURNING id, path
+        ''', (job_id, limit)).fetchall()
+    return sorted(rows)
+
+
+def completeJobItems(conn, results):
+    """Store the outcome of claimed items in one transaction
+
+    results is a list of (item id, prediction row or None, content hash,
+    error). Each row is inserted into predictions and its item marked done
+    with the new prediction id in the same transaction, so after a crash
+    an item is either done with its row or still claimed without one.
+    """
+    prediction_date = timestamp()
+    with conn:
+        for item_id, row, content_hash, error in results:
+            prediction_id = None
+            if row is not None:
+                prediction_id = conn.execute(INSERT_PREDICTION, _predictionValues(row, prediction_date)).lastrowid
+            conn.execute('UPDATE job_items SET status = ?, content_hash = ?, prediction_id = ?, error = ? WHERE id = ?',
+                         ('done' if row is not None else 'failed', content_hash, prediction_id, error, item_id))
+
+
+def finishJob(conn, job_id):
+    with conn:
+        conn.execute("UPDATE jobs SET status = 'done', finished_date = ? WHERE id = ?", (timestamp(), job_id))
+
+
+def connect(db_path=DB_PATH, check_same_thread=True):
+    """Open the database in WAL mode and make sure the schema exists
+
+    Pass check_same_thread=False for a connection shared between threads
+    behind a lock.
+    """
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=check_same_thread,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    conn.execute(f'PRAGMA journal_mode = {JOURNAL_MODE}')
+    conn.execute(f'PRAGMA synchronous = {SYNCHRONOUS}')
+    createTables(conn)
+    return conn
+
+
+class PredictionDatabase:
+    """All reads and writes of the predictions table over one long-lived connection
+
+    The SQL strings are constant, so sqlite3's statement cache prepares each
+    of them once per connection. A lock serialises access, so threads may
+    share the instance.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.conn = connect(db_path, check_same_thread=False)
+        self.filename_index = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'predictions_filename'").fetchone() is not None
+
+    def insert(self, rows):
+        """Insert prediction rows (see insertPredictions) in one transaction"""
+        with self._lock:
+            insertPredictions(self.conn, rows)
+
+    def fetchAll(self, descending=False):
+        """Return (column names, rows) of every prediction ordered by id"""
+        with self._lock:
+            cursor = self.conn.execute(f'SELECT * FROM predictions ORDER BY id {"DESC" if descending else "ASC"}')
+            return [column[0] for column in cursor.description], cursor.fetchall()
+
+    def pageIds(self, after_id=0, limit=256, search='', result=None):
+        """Return up to limit ids above after_id, ascending, of the predictions matching the filter
+
+        search matches part of the filename, ignoring case, and result the
+        exact result text. Paging by id uses the primary key (and the
+        result and filename indexes), so a page costs the same at the end
+        of the table as at its start.
+        """
+        query, params = _historyQuery(search, result, self.filename_index)
+        with self._lock:
+            return [row[0] for row in self.conn.execute(query, [after_id, *params, limit])]
+
+    def fetchColumns(self, ids, columns=HISTORY_COLUMNS):
+        """Return {id: row of columns} for the predictions with the given ids"""
+        ids = list(ids)
+        rows = {}
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                for row in self.conn.execute(
+                        f'SELECT id, {", ".join(columns)} FROM predictions '
+                        f'WHERE id IN ({", ".join("?" * len(chunk))})', chunk):
+                    rows[row[0]] = row[1:]
+        return rows
+
+    def delete(self, prediction_id):
+        """Delete one prediction; returns True if it existed"""
+        with self._lock, self.conn:
+            return self.conn.execute('DELETE FROM predictions WHERE id = ?', (prediction_id,)).rowcount > 0
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class PredictionWriter:
+    """Background thread that group-commits prediction rows
+
+    submit() only queues the rows. The writer commits everything queued in
+    one transaction once max_rows rows are waiting or max_delay_ms after
+    the first of them arrived, so a burst of predictions costs one sync
+    instead of one per row. Its connection uses synchronous=FULL, which
+    the grouping makes affordable, so a commit is on disk when the
+    callbacks run. flush() and close() commit what is queued at once.
+    """
+
+    def __init__(self, db_path=DB_PATH, max_rows=WRITER_MAX_ROWS, max_delay_ms=WRITER_MAX_DELAY_MS):
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self.commits = 0
+        self.conn = connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA synchronous = FULL')
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='prediction-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, rows, callback=None):
+        """Queue prediction rows (see insertPredictions) for the next group commit
+
+        callback(ids) is called on the writer thread once the rows are
+        committed, with their new ids, or with None if the commit failed.
+        """
+        self._queue.put((list(rows), callback))
+
+    def flush(self):
+        """Commit everything submitted so far without waiting for max_delay_ms and block until it is"""
+        done = threading.Event()
+        self._queue.put(([], lambda ids: done.set()))
+        done.wait()
+
+    def close(self):
+        """Commit the queued rows and stop the writer thread"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self.conn.close()
+
+    def _run(self):
+        pending = []
+        pending_rows = 0
+        deadline = None
+        stopping = False
+
+        while not stopping or pending:
+            if not stopping:
+                try:
+                    item = self._queue.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    item = False
+                if item is None:
+                    stopping = True
+                elif item is not False:
+                    # a submission without rows, as flush() sends, commits the group at once
+                    pending.append(item)
+                    pending_rows += len(item[0])
+                    if deadline is None:
+                        deadline = time.monotonic() + self.max_delay
+                    if item[0] and pending_rows < self.max_rows and time.monotonic() < deadline:
+                        continue
+
+            if pending:
+                self._commit(pending)
+            pending = []
+            pending_rows = 0
+            deadline = None
+
+    def _commit(self, pending):
+        """Insert the pending rows in one transaction and run their callbacks
+
+        If the group fails, each submission is retried on its own so one bad
+        row only fails its own submit(). Errors in the insert or a callback
+        are logged and never stop the thread, or every later submit() would
+        be lost and flush() would hang.
+        """
+        try:
+            ids = insertPredictions(self.conn, [row for rows, _ in pending for row in rows])
+            self.commits += 1
+        except Exception as e:
+            if len(pending) > 1:
+                for item in pending:
+                    self._commit([item])
+                return
+            print(f"Error writing {len(pending[0][0])} predictions: {e}")
+            ids = None
+
+        start = 0
+        for rows, callback in pending:
+            if callback is not None:
+                try:
+                    callback(None if ids is None else ids[start:start + len(rows)])
+                except Exception as e:
+                    print(f"Error in prediction writer callback: {e}")
+            start += len(rows)
+
+
+class PredictionHistory:
+    """Look up earlier results for identical or nearly identical images
+
+    Byte-identical images are found through the content_hash index. For
+    near duplicates the perceptual hashes of a model's past predictions are
+    loaded into a BK-tree the first time nearest() is asked about that
+    model version, so opening the history costs nothing when near-duplicate reuse
+    is off. New results are added with remember(). Uses its own connection
+    behind a lock so the prediction threads can share it.
+
+    Only rows of the same model_used and model_version match, and rows
+    answered by the vegetation pre-filter are never reused as model results.
+    Rows answered from an earlier result are saved without a phash, so a
+    near duplicate always matches an image the model classified itself and
+    reuse cannot chain from one near duplicate to the next.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self._lock = threading.Lock()
+        self.conn = connect(db_path, check_same_thread=False)
+        self.trees = {}
+
+    def _tree(self, model, version):
+        """Return the BK-tree of a model version, loading it from the predictions table on first use"""
+        tree = self.trees.get((model, version))
+        if tree is None:
+            tree = self.trees[model, version] = BKTree()
+            cursor = self.conn.execute(f'''
+                SELECT phash, result, confidence FROM predictions
+                WHERE model_used = ? AND model_version = ? AND {REUSABLE_PREDICTION}
+                  AND phash IS NOT NULL AND confidence IS NOT NULL
+                ORDER BY id
+            ''', (model, version))
+            for phash, result, confidence in cursor:
+                tree.add(fromSigned64(phash), (result, confidence))
+        return tree
+
+    def lookup(self, content_hashes, model, version):
+        """Return {content_hash: (result, confidence)} of the latest prediction by this model version"""
+        content_hashes = [content_hash for content_hash in dict.fromkeys(content_hashes) if content_hash]
+        found = {}
+        with self._lock:
+            for start in range(0, len(content_hashes), 500):
+                chunk = content_hashes[start:start + 500]
+                cursor = self.conn.execute(f'''
+                    SELECT content_hash, result, confidence FROM predictions
+                    WHERE model_used = ? AND model_version = ? AND {REUSABLE_PREDICTION} AND confidence IS NOT NULL
+                      AND content_hash IN ({', '.join('?' * len(chunk))})
+                    ORDER BY id
+                ''', [model, version, *chunk])
+                for content_hash, result, confidence in cursor:
+                    found[content_hash] = (result, confidence)
+        return found
+
+    def nearest(self, phash, model, version, radius):
+        """Return (distance, result, confidence) of the closest past image within radius bits, or None"""
+        with self._lock:
+            match = self._tree(model, version).nearest(phash, radius)
+        if match is None:
+            return None
+        distance, _, (result, confidence) = match
+        return distance, result, confidence
+
+    def remember(self, phash, model, version, result, confidence):
+        """Add a new result to the near-duplicate index of a model version, if it has been loaded"""
+        with self._lock:
+            tree = self.trees.get((model, version))
+            if tree is not None:
+                tree.add(phash, (result, confidence))
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class FeatureStore:
+    """Feature vectors cached in the features table as float32 blobs
+
+    Rows are keyed by the content hash of the image file, the feature method
+    and the extractor version, so renamed or copied files still hit and a
+    new extractor version never returns stale vectors. Rows not used for
+    max_age_days are dropped, then the least recently used ones beyond
+    max_rows. Safe to share between threads.
+    """
+
+    def __init__(self, db_path=DB_PATH, max_rows=FEATURE_STORE_MAX_ROWS, max_age_days=FEATURE_STORE_MAX_AGE_DAYS):
+        self.max_rows = max_rows
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.conn = connect(db_path, check_same_thread=False)
+        self.evict()
+
+    def getMany(self, content_hashes, method, version):
+        """Return {content_hash: float32 vector} for the hashes that are stored"""
+        content_hashes = list(dict.fromkeys(content_hashes))
+        found = {}
+        with self._lock:
+            for start in range(0, len(content_hashes), 500):
+                chunk = content_hashes[start:start + 500]
+                cursor = self.conn.execute(f'''
+                    SELECT content_hash, vector FROM features
+                    WHERE method = ? AND version = ? AND content_hash IN ({', '.join('?' * len(chunk))})
+                ''', [method, version, *chunk])
+                for content_hash, vector in cursor:
+                    found[content_hash] = np.frombuffer(vector, dtype=np.float32)
+
+            if found:
+                with self.conn:
+                    self.conn.executemany(
+                        'UPDATE features SET last_used = ? WHERE content_hash = ? AND method = ? AND version = ?',
+                        [(timestamp(), content_hash, method, version) for content_hash in found])
+            self.hits += len(found)
+            self.misses += len(content_hashes) - len(found)
+        return found
+
+    def putMany(self, vectors, method, version):
+        """Store (content_hash, vector) pairs and evict old rows"""
+        now = timestamp()
+        with self._lock:
+            with self.conn:
+                self.conn.executemany('''
+                    INSERT OR REPLACE INTO features (content_hash, method, version, vector, last_used)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [(content_hash, method, version, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                      for content_hash, vector in vectors])
+        self.evict()
+
+    def evict(self):
+        """Delete rows older than max_age_days and the oldest rows beyond max_rows"""
+        cutoff = timestamp(datetime.now() - timedelta(days=self.max_age_days))
+        with self._lock:
+            with self.conn:
+                self.conn.execute('DELETE FROM features WHERE last_used < ?', (cutoff,))
+                self.conn.execute('''
+                    DELETE FROM features WHERE rowid IN (
+                        SELECT rowid FROM features ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (self.max_rows,))
+
+    def clear(self):
+        with self._lock:
+            with self.conn:
+                self.conn.execute('DELETE FROM features')
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,463 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+import features
+import models
+import forest
+
+Prediction = namedtuple('Prediction', ['image_path', 'label', 'result', 'confidence', 'error',
+                                       'content_hash', 'cached', 'phash', 'distance', 'stage', 'model_version'],
+                        defaults=(None, False, None, None, None, None))
+
+BACKENDS = ['sklearn', 'compiled']
+
+
+class PredictionEngine:
+    """Classify images with the joblib models using one predict_proba pass per batch"""
+
+    def __init__(self, model_directory=models.MODEL_DIRECTORY, backend='sklearn', feature_store=None, history=None,
+                 near_radius=0, min_vegetation=0.0):
+        self.model_directory = model_directory
+        self.feature_store = feature_store
+        self.history = history
+        self.near_radius = near_radius
+        self.min_vegetation = min_vegetation
+        self.cascade_order, self.cascade_thresholds = models.loadCascadeConfig(model_directory)
+        self.models = {}
+        self.compiled = {}
+        self.versions = {}
+        self.states = {}
+        self.setBackend(backend)
+        self._executor = None
+        self._load_lock = threading.Lock()
+
+        for model_name_prefix in models.MODEL_NAMES:
+            if os.path.exists(models.modelPath(model_name_prefix, self.model_directory)):
+                self.states[model_name_prefix] = 'unloaded'
+            else:
+                self.states[model_name_prefix] = 'missing'
+
+    def load(self, model_name_prefix):
+        """Load and warm up one model; safe to call from several threads"""
+        with self._load_lock:
+            if model_name_prefix in self.models:
+                return self.models[model_name_prefix]
+
+            self.states[model_name_prefix] = 'loading'
+            version = models.modelFileVersion(model_name_prefix, self.model_directory)
+            try:
+                model = models.loadModel(model_name_prefix, self.model_directory)
+                self.warmUp(model)
+            except Exception:
+                self.states[model_name_prefix] = 'error'
+                raise
+
+            self.models[model_name_prefix] = model
+            self.versions[model_name_prefix] = version
+            self.states[model_name_prefix] = 'ready'
+            return model
+
+    def setBackend(self, backend):
+        """Choose stock sklearn inference or the compiled NumPy forest"""
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend '{backend}' tidak dikenal.")
+        self.backend = backend
+
+    def compiledModel(self, model_name_prefix, model):
+        """Return the verified compiled forest for a model, or the model itself if it cannot be compiled"""
+        compiled = self.compiled.get(model_name_prefix)
+        if compiled is None:
+            try:
+                compiled = forest.compileForest(model)
+            except Exception as e:
+                print(f"Cannot compile {model_name_prefix}, using sklearn: {e}")
+                compiled = model
+            self.compiled[model_name_prefix] = compiled
+        return compiled
+
+    def warmUp(self, model):
+        """Run one dummy prediction so the first real call does not pay setup costs"""
+        n_features = getattr(model, 'n_features_in_', None)
+        if n_features:
+            model.predict_proba(np.zeros((1, n_features)))
+
+    def loadAvailable(self, model_names=models.MODEL_NAMES):
+        """Load every model file that exists, returning {name: error} for failures"""
+        errors = {}
+        for model_name_prefix in model_names:
+            if self.states.get(model_name_prefix) == 'missing':
+                continue
+            try:
+                self.load(model_name_prefix)
+            except Exception as e:
+                errors[model_name_prefix] = e
+        return errors
+
+    def members(self, model_name_prefix):
+        """Return {name: model} used for a selection, loading models on first use"""
+        loaded = {}
+        for name in models.memberNames(model_name_prefix):
+            if self.states.get(name) in ('unloaded', 'loading', 'ready'):
+                try:
+                    loaded[name] = self.load(name)
+                except Exception as e:
+                    print(f"Error loading {name}: {e}")
+        return loaded
+
+    def modelVersion(self, model_name_prefix):
+        """Identity of the model files behind a selection, stored with its results
+
+        Loaded members count with the file they were loaded from, the others
+        with the file on disk now, and the cascade with its thresholds too.
+        Results are only reused for the same version, so a retrained or
+        replaced .pkl never answers with the old model's results.
+        """
+        parts = [f'{name}={self.versions.get(name) or models.modelFileVersion(name, self.model_directory)}'
+                 for name in models.memberNames(model_name_prefix)]
+        if model_name_prefix == models.CASCADE_NAME:
+            try:
+                stat = os.stat(models.cascadeThresholdsPath(self.model_directory))
+                parts.append(f'thresholds={stat.st_size}-{stat.st_mtime_ns}')
+            except OSError:
+                pass
+        return hashlib.blake2b(';'.join(parts).encode(), digest_size=8).hexdigest()
+
+    def isAvailable(self, model_name_prefix):
+        """Check without loading whether a selection has at least one usable model file"""
+        return any(self.states.get(name) in ('unloaded', 'loading', 'ready')
+                   for name in models.memberNames(model_name_prefix))
+
+    def _storedFeatures(self, methods, content_hashes):
+        """{method: {content_hash: vector}} already in the feature store"""
+        stored = {method: {} for method in methods}
+        if self.feature_store is None:
+            return stored
+
+        for method in methods:
+            try:
+                found = self.feature_store.getMany(content_hashes, method, features.EXTRACTOR_VERSIONS[method])
+            except sqlite3.Error as e:
+                print(f"Feature store lookup failed: {e}")
+                continue
+            stored[method] = {content_hash: vector for content_hash, vector in found.items()
+                              if vector.size == features.FEATURE_SIZES[method]}
+        return stored
+
+    def _memberFeatures(self, method, content_hashes, images, stored):
+        """Feature matrix for one method: stored rows are copied, the rest extracted and stored"""
+        if not stored:
+            matrix = features.featureMatrix(images, method)
+            missing = range(len(images))
+        else:
+            matrix = np.empty((len(images), features.FEATURE_SIZES[method]), dtype=np.float32)
+            missing = []
+            for row, content_hash in enumerate(content_hashes):
+                vector = stored.get(content_hash)
+                if vector is None:
+                    missing.append(row)
+                else:
+                    matrix[row] = vector
+            if missing:
+                matrix[missing] = features.featureMatrix([images[row] for row in missing], method)
+
+        new_rows = [(content_hashes[row], matrix[row]) for row in missing if content_hashes[row] is not None]
+        if self.feature_store is not None and new_rows:
+            try:
+                self.feature_store.putMany(new_rows, method, features.EXTRACTOR_VERSIONS[method])
+            except sqlite3.Error as e:
+                print(f"Feature store update failed: {e}")
+        return matrix
+
+    def _memberProba(self, model_name_prefix, model, content_hashes, images, stored, classes):
+        """Build the member's feature matrix and run predict_proba once, aligned to classes"""
+        method = models.featureMethod(model_name_prefix)
+        feature_matrix = self._memberFeatures(method, content_hashes, images, stored[method])
+        if self.backend == 'compiled':
+            model = self.compiledModel(model_name_prefix, model)
+        proba = model.predict_proba(feature_matrix)
+        if np.array_equal(model.classes_, classes):
+            return proba
+
+        aligned = np.zeros((len(images), len(classes)))
+        aligned[:, np.searchsorted(classes, model.classes_)] = proba
+        return aligned
+
+    def _proba(self, members, content_hashes, images, stored, classes):
+        """Class probabilities for the images; a weighted soft vote for several members"""
+        if len(members) == 1:
+            (name, model), = members.items()
+            return self._memberProba(name, model, content_hashes, images, stored, classes)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(models.MODEL_NAMES), thread_name_prefix='ensemble')
+
+        futures = {
+            name: self._executor.submit(self._memberProba, name, model, content_hashes, images, stored, classes)
+            for name, model in members.items()
+        }
+        votes = np.zeros((len(images), len(classes)))
+        total_weight = 0.0
+        for name, future in futures.items():
+            weight = models.MODEL_WEIGHTS.get(name, 1.0)
+            votes += weight * future.result()
+            total_weight += weight
+        return votes / total_weight
+
+    def _pastResults(self, content_hashes, model_name_prefix, version):
+        """{content_hash: (result, confidence)} already recorded for this model version"""
+        if self.history is None:
+            return {}
+        try:
+            return self.history.lookup(content_hashes, model_name_prefix, version)
+        except sqlite3.Error as e:
+            print(f"Prediction history lookup failed: {e}")
+            return {}
+
+    def cascadeThreshold(self, model_name_prefix, label):
+        """Minimum confidence at which a cascade stage may answer with label"""
+        return self.cascade_thresholds.get(model_name_prefix, {}).get(label, models.DEFAULT_CASCADE_THRESHOLD)
+
+    def _cascadeProba(self, members, content_hashes, images, stored, classes):
+        """Run the members in cascade_order, cheapest first; a row is answered by the first stage confident enough
+
+        Returns the probabilities and, per row, the name of the stage that
+        answered. A row no stage is confident enough about takes the answer
+        of the stage that was most confident about it, not the last one.
+        """
+        proba = np.zeros((len(images), len(classes)))
+        stages = [None] * len(images)
+        fallback = np.full(len(images), -1.0)
+        names = [name for name in self.cascade_order if name in members]
+        pending = np.arange(len(images))
+
+        for name in names:
+            stage_proba = self._memberProba(name, members[name], [content_hashes[row] for row in pending],
+                                            [images[row] for row in pending], stored, classes)
+            best = stage_proba.argmax(axis=1)
+            confidence = stage_proba[np.arange(len(pending)), best]
+            thresholds = np.array([self.cascadeThreshold(name, label.item()) for label in classes])
+            accepted = confidence >= thresholds[best]
+
+            more_confident = ~accepted & (confidence > fallback[pending])
+            proba[pending[accepted | more_confident]] = stage_proba[accepted | more_confident]
+            fallback[pending[more_confident]] = confidence[more_confident]
+            for row in pending[accepted | more_confident]:
+                stages[row] = name
+            pending = pending[~accepted]
+            if not len(pending):
+                break
+        return proba, stages
+
+    def _classify(self, members, model_name_prefix, content_hashes, images, stored):
+        """Return (label, confidence, stage) for each image from the selected model(s)"""
+        classes = np.unique(np.concatenate([model.classes_ for model in members.values()]))
+        if model_name_prefix == models.CASCADE_NAME:
+            proba, stages = self._cascadeProba(members, content_hashes, images, stored, classes)
+        else:
+            proba = self._proba(members, content_hashes, images, stored, classes)
+            stages = [None] * len(images)
+        best = proba.argmax(axis=1)
+        return [(classes[best[row]].item(), float(proba[row, best[row]]), stages[row]) for row in range(len(images))]
+
+    def _isNonLeaf(self, image):
+        """True when the vegetation pre-filter rejects a decoded image"""
+        return self.min_vegetation > 0 and features.vegetationCoverage(image.bgr) < self.min_vegetation
+
+    def _coverages(self, image_paths, indices, content_hashes, cache):
+        """Return ({index: vegetation coverage}, {index: decoded image}, {index: error})
+
+        Coverage is kept in the feature store next to the feature vectors,
+        keyed by content hash, so the pre-filter decides the same whether or
+        not the other features of an image are stored. Only images without a
+        stored coverage are decoded.
+        """
+        stored = {}
+        if self.feature_store is not None:
+            try:
+                stored = self.feature_store.getMany(content_hashes, features.VEGETATION_METHOD,
+                                                    features.VEGETATION_VERSION)
+            except sqlite3.Error as e:
+                print(f"Feature store lookup failed: {e}")
+
+        coverages = {}
+        decoded = {}
+        errors = {}
+        new_rows = []
+        for i, content_hash in zip(indices, content_hashes):
+            vector = stored.get(content_hash)
+            if vector is not None and vector.size == 1:
+                coverages[i] = float(vector[0])
+                continue
+            try:
+                image = features.loadImage(image_paths[i], cache)
+            except Exception as e:
+                errors[i] = str(e)
+                continue
+            decoded[i] = image
+            coverages[i] = features.vegetationCoverage(image.bgr)
+            if content_hash is not None:
+                new_rows.append((content_hash, np.array([coverages[i]], dtype=np.float32)))
+
+        if self.feature_store is not None and new_rows:
+            try:
+                self.feature_store.putMany(new_rows, features.VEGETATION_METHOD, features.VEGETATION_VERSION)
+            except sqlite3.Error as e:
+                print(f"Feature store update failed: {e}")
+        return coverages, decoded, errors
+
+    def _nonLeafPrediction(self, image_path, content_hash=None, phash=None):
+        return Prediction(image_path, models.NON_LEAF_LABEL, models.resultText(models.NON_LEAF_LABEL), 1.0, None,
+                          content_hash, False, phash, None, models.PREFILTER_STAGE)
+
+    def predict_batch(self, image_paths, model_name_prefix, cache=None):
+        """Classify many images with a single predict_proba call per model
+
+        With a prediction history, images whose exact bytes were already
+        classified by the same model files (see modelVersion) get the recorded result back with
+        cached=True. If near_radius is set, so do images whose perceptual
+        hash is within near_radius bits of a past one (distance tells how
+        far). With a feature store, vectors are looked up by content hash
+        next and only images missing a vector for some member are decoded,
+        each once. Images that cannot be read get a Prediction with error
+        set instead of failing the whole batch. For the cascade, stage names
+        the model that answered.
+
+        Before any of that, images whose vegetation coverage is below
+        min_vegetation are answered as non-leaf, with stage set to PREFILTER.
+        The coverage is stored with the features, so the gate does not
+        depend on what is cached.
+        """
+        if not self.isAvailable(model_name_prefix):
+            raise ValueError(f"Model {model_name_prefix} tidak tersedia atau gagal dimuat!")
+
+        results = [None] * len(image_paths)
+        hashing = self.feature_store is not None or self.history is not None
+        readable = []
+        content_hashes = []
+        for i, image_path in enumerate(image_paths):
+            try:
+                content_hashes.append(features.contentHash(image_path) if hashing else None)
+                readable.append(i)
+            except Exception as e:
+                results[i] = Prediction(image_path, None, None, None, str(e))
+
+        decoded = {}
+        if self.min_vegetation > 0:
+            coverages, decoded, errors = self._coverages(image_paths, readable, content_hashes, cache)
+            remaining = []
+            for i, content_hash in zip(readable, content_hashes):
+                if i in errors:
+                    results[i] = Prediction(image_paths[i], None, None, None, errors[i])
+                elif coverages[i] < self.min_vegetation:
+                    results[i] = self._nonLeafPrediction(image_paths[i], content_hash)
+                else:
+                    remaining.append((i, content_hash))
+            readable = [i for i, _ in remaining]
+            content_hashes = [content_hash for _, content_hash in remaining]
+            if not readable:
+                return results
+
+        version = self.modelVersion(model_name_prefix)
+        past = self._pastResults(content_hashes, model_name_prefix, version) if hashing else {}
+        if past:
+            remaining = []
+            for i, content_hash in zip(readable, content_hashes):
+                if content_hash in past:
+                    result, confidence = past[content_hash]
+                    results[i] = Prediction(image_paths[i], None, result, confidence, None, content_hash, True,
+                                            model_version=version)
+                else:
+                    remaining.append((i, content_hash))
+            readable = [i for i, _ in remaining]
+            content_hashes = [content_hash for _, content_hash in remaining]
+            if not readable:
+                return results
+
+        members = self.members(model_name_prefix)
+        if not members:
+            raise ValueError(f"Model {model_name_prefix} tidak tersedia atau gagal dimuat!")
+
+        methods = [models.featureMethod(name) for name in members]
+        stored = self._storedFeatures(methods, content_hashes)
+
+        near_duplicates = self.history is not None and self.near_radius > 0
+        valid = []
+        images = []
+        row_hashes = []
+        row_phashes = []
+        for i, content_hash in zip(readable, content_hashes):
+            image = decoded.get(i)
+            if image is None and (near_duplicates or any(content_hash not in stored[method] for method in methods)):
+                try:
+                    image = features.loadImage(image_paths[i], cache)
+                except Exception as e:
+                    results[i] = Prediction(image_paths[i], None, None, None, str(e))
+                    continue
+            phash = features.perceptualHash(image.gray) if image is not None else None
+
+            if near_duplicates:
+                match = self.history.nearest(phash, model_name_prefix, version, self.near_radius)
+                if match is not None:
+                    distance, result, confidence = match
+                    results[i] = Prediction(image_paths[i], None, result, confidence, None,
+                                            content_hash, True, phash, distance, model_version=version)
+                    continue
+
+            valid.append(i)
+            images.append(image)
+            row_hashes.append(content_hash)
+            row_phashes.append(phash)
+
+        if valid:
+            answers = self._classify(members, model_name_prefix, row_hashes, images, stored)
+            for row, (i, (label, confidence, stage)) in enumerate(zip(valid, answers)):
+                result = models.resultText(label)
+                results[i] = Prediction(image_paths[i], label, result, confidence, None,
+                                        row_hashes[row], False, row_phashes[row], None, stage, version)
+                if self.history is not None and row_phashes[row] is not None:
+                    self.history.remember(row_phashes[row], model_name_prefix, version, result, confidence)
+        return results
+
+    def predictImages(self, images, model_name_prefix):
+        """Classify already decoded PreprocessedImages, such as the tiles of a large image
+
+        The vegetation pre-filter applies; the history and the feature store
+        do not, as the images have no file of their own. The Predictions
+        have image_path set to None.
+        """
+        members = self.members(model_name_prefix)
+        if not members:
+            raise ValueError(f"Model {model_name_prefix} tidak tersedia atau gagal dimuat!")
+
+        results = [None] * len(images)
+        rows = []
+        for i, image in enumerate(images):
+            if self._isNonLeaf(image):
+                results[i] = self._nonLeafPrediction(None)
+            else:
+                rows.append(i)
+
+        if rows:
+            stored = {models.featureMethod(name): {} for name in members}
+            answers = self._classify(members, model_name_prefix, [None] * len(rows),
+                                     [images[i] for i in rows], stored)
+            for i, (label, confidence, stage) in zip(rows, answers):
+                results[i] = Prediction(None, label, models.resultText(label), confidence, None, stage=stage)
+        return results
+
+    def predict(self, image_path, model_name_prefix, cache=features.preprocess_cache):
+        """Classify one image, raising ValueError if it cannot be processed"""
+        prediction = self.predict_batch([image_path], model_name_prefix, cache)[0]
+        if prediction.error is not None:
+            raise ValueError(prediction.error)
+        return prediction
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
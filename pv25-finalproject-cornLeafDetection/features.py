@@ -0,0 +1,460 @@
+import os
+import glob
+import hashlib
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+IMAGE_SIZE = (256, 256)
+GLCM_LEVELS = 256
+LBP_POINTS = 8
+LBP_RADIUS = 1
+# Vegetation pre-filter: share of pixels in a 32x32 thumbnail whose OpenCV hue
+# (0-180) lies between yellow-brown lesions and green, with some colour and light
+PREFILTER_SIZE = (32, 32)
+VEGETATION_HSV_LOW = (15, 30, 25)
+VEGETATION_HSV_HIGH = (95, 255, 255)
+PREFILTER_MIN_COVERAGE = 0.2
+# vegetationCoverage is kept in the feature store like a 1-element feature vector
+VEGETATION_METHOD = 'VEGETATION'
+VEGETATION_VERSION = 1
+PHASH_SIZE = 8  # perceptualHash compares a 9x8 thumbnail, giving 64 bits
+LBP_CHUNK_PIXELS = 256 * 256  # pixels per pass of extractLBPBatch, keeps the scratch arrays in cache
+FEATURE_METHODS = ['COLOR', 'LBP', 'GLCM']
+FEATURE_SIZES = {'COLOR': 3 * 256, 'LBP': LBP_POINTS + 2, 'GLCM': 4}
+# Bump a method's version whenever its output changes, so stored vectors are not reused
+EXTRACTOR_VERSIONS = {'COLOR': 2, 'LBP': 2, 'GLCM': 2}
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif')
+JPEG_EXTENSIONS = ('.jpg', '.jpeg')
+JPEG_HEADER_BYTES = 64 * 1024  # SOF is normally within the first few KiB, after EXIF and the tables
+# libjpeg can decode at 1/8, 1/4 or 1/2 scale for little more than the cost of the smaller image
+REDUCED_DECODE_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                        (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+def collectImages(inputs):
+    """Expand files, directories and glob patterns into a sorted list of image files"""
+    image_paths = set()
+    for item in inputs:
+        if os.path.isfile(item):
+            candidates = [item]
+        elif os.path.isdir(item):
+            candidates = [os.path.join(item, name) for name in os.listdir(item)]
+        else:
+            candidates = glob.glob(item, recursive=True)
+        for path in candidates:
+            if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS):
+                image_paths.add(os.path.abspath(path))
+    return sorted(image_paths)
+
+
+def extractGLCMBatch(gray_stack):
+    """GLCM contrast, correlation, energy and homogeneity for a stack of uint8 images
+
+    Equivalent to graycomatrix(distances=[1], angles=[0], symmetric=True,
+    normed=True) and graycoprops for each image, but all N co-occurrence
+    matrices come from a single bincount. Returns an (N, 4) array.
+    """
+    gray_stack = np.asarray(gray_stack)
+    if gray_stack.ndim == 2:
+        gray_stack = gray_stack[np.newaxis]
+    if gray_stack.dtype != np.uint8 or gray_stack.ndim != 3 or gray_stack.size == 0:
+        raise ValueError("Gambar kosong atau tidak valid untuk ekstraksi GLCM.")
+
+    n_images = gray_stack.shape[0]
+    levels = GLCM_LEVELS
+
+    # Pixel pairs at distance 1, angle 0. With symmetric=True the GLCM is
+    # D + D.T where D counts unordered pairs (min, max), so D is all we count.
+    left = gray_stack[:, :, :-1]
+    right = gray_stack[:, :, 1:]
+    pair_index = np.minimum(left, right).astype(np.uint32)
+    pair_index <<= 8
+    pair_index |= np.maximum(left, right)
+    pair_index += (np.arange(n_images, dtype=np.uint32) * (levels * levels))[:, np.newaxis, np.newaxis]
+    pairs = np.bincount(pair_index.ravel(), minlength=n_images * levels * levels)
+    pairs = pairs.reshape(n_images, levels, levels).astype(np.float64)
+
+    # normalize so that D + D.T sums to one
+    pair_sums = pairs.sum(axis=(1, 2), keepdims=True)
+    pair_sums[pair_sums == 0] = 0.5
+    pairs /= 2 * pair_sums
+
+    level_values = np.arange(levels, dtype=np.float64)
+    level_diff = level_values[:, np.newaxis] - level_values[np.newaxis, :]
+    pairs_flat = pairs.reshape(n_images, -1)
+    diagonal = pairs_flat[:, ::levels + 1]
+
+    # for a symmetric weight W: sum((D + D.T) * W) == 2 * sum(D * W)
+    contrast = 2 * (pairs_flat @ (level_diff ** 2).ravel())
+    homogeneity = 2 * (pairs_flat @ (1.0 / (1.0 + level_diff ** 2)).ravel())
+    energy = np.sqrt(2 * np.einsum('ij,ij->i', pairs_flat, pairs_flat)
+                     + 2 * np.einsum('ij,ij->i', diagonal, diagonal))
+
+    # both marginals of the symmetric GLCM are row sums + column sums of D
+    marginal = pairs.sum(axis=2) + pairs.sum(axis=1)
+    diff = level_values - (marginal @ level_values)[:, np.newaxis]
+    std = np.sqrt(np.einsum('ni,ni->n', marginal, diff ** 2))
+    cov = 2 * np.einsum('nj,nj->n', (diff[:, np.newaxis, :] @ pairs)[:, 0, :], diff)
+
+    # same special case as graycoprops for (near) constant images
+    correlation = np.ones(n_images)
+    valid = std >= 1e-15
+    correlation[valid] = cov[valid] / (std[valid] * std[valid])
+
+    return np.column_stack([contrast, correlation, energy, homogeneity])
+
+
+def extractGLCM(gray_uint8):
+    """Extract GLCM features"""
+    if gray_uint8.size == 0 or gray_uint8.ndim < 2:
+        raise ValueError("Gambar kosong atau tidak valid untuk ekstraksi GLCM.")
+    return extractGLCMBatch(gray_uint8)[0]
+
+
+def _lbpUniformLookup(points):
+    """Map every raw LBP code to its 'uniform' bin the way skimage counts transitions"""
+    lookup = np.empty(2 ** points, dtype=np.intp)
+    for code in range(2 ** points):
+        bits = [(code >> i) & 1 for i in range(points)]
+        changes = sum(bits[i] != bits[i + 1] for i in range(points - 1))
+        lookup[code] = sum(bits) if changes <= 2 else points + 1
+    return lookup
+
+
+LBP_UNIFORM_LOOKUP = _lbpUniformLookup(LBP_POINTS)
+
+
+def extractLBPBatch(gray_stack):
+    """Normalized uniform LBP (P=8, R=1) histograms for a stack of images, shape (N, 10)
+
+    Same result as local_binary_pattern(method='uniform') followed by
+    np.histogram for each image. Neighbours on the circle are bilinearly
+    interpolated with zero padding using skimage's arithmetic, the 8
+    comparison bits form a raw code, and a lookup table maps the 256 codes
+    to the 10 uniform bins. The stack is processed in chunks of about
+    LBP_CHUNK_PIXELS so the intermediate arrays stay small.
+
+    uint8 stacks are scaled to [0, 1] per chunk, exactly like the float32
+    images the models were trained on.
+    """
+    gray_stack = np.asarray(gray_stack)
+    if gray_stack.ndim == 2:
+        gray_stack = gray_stack[np.newaxis]
+    if gray_stack.ndim != 3 or gray_stack.size == 0:
+        raise ValueError("Gambar kosong atau tidak valid untuk ekstraksi LBP.")
+
+    chunk = max(1, LBP_CHUNK_PIXELS // (gray_stack.shape[1] * gray_stack.shape[2]))
+    return np.vstack([_lbpHistograms(gray_stack[start:start + chunk])
+                      for start in range(0, len(gray_stack), chunk)])
+
+
+def _lbpHistograms(gray_stack):
+    """extractLBPBatch for one chunk of a validated stack"""
+    if gray_stack.dtype == np.uint8:
+        gray_stack = gray_stack.astype(np.float32) / 255.0
+    gray_stack = np.asarray(gray_stack, dtype=np.float64)
+    n_images, rows, cols = gray_stack.shape
+    points = LBP_POINTS
+    radius = LBP_RADIUS
+
+    padded = np.zeros((n_images, rows + 2 * radius, cols + 2 * radius))
+    padded[:, radius:radius + rows, radius:radius + cols] = gray_stack
+
+    def shifted(row_offset, col_offset):
+        return padded[:, radius + row_offset:radius + row_offset + rows,
+                      radius + col_offset:radius + col_offset + cols]
+
+    angles = 2 * np.pi * np.arange(points, dtype=np.float64) / points
+    row_offsets = np.round(-radius * np.sin(angles), 5)
+    col_offsets = np.round(radius * np.cos(angles), 5)
+    row_positions = np.arange(rows, dtype=np.float64)[:, np.newaxis]
+    col_positions = np.arange(cols, dtype=np.float64)[np.newaxis, :]
+
+    codes = np.zeros((n_images, rows, cols), dtype=np.uint8)
+    bits = np.empty((n_images, rows, cols), dtype=np.uint8)
+    is_set = np.empty((n_images, rows, cols), dtype=bool)
+    top = np.empty((n_images, rows, cols))
+    bottom = np.empty((n_images, rows, cols))
+    scratch = np.empty((n_images, rows, cols))
+
+    for i in range(points):
+        min_row, max_row = int(np.floor(row_offsets[i])), int(np.ceil(row_offsets[i]))
+        min_col, max_col = int(np.floor(col_offsets[i])), int(np.ceil(col_offsets[i]))
+
+        if min_row == max_row and min_col == max_col:
+            texture = shifted(min_row, min_col)
+        else:
+            # bilinear_interpolation from skimage, operation for operation
+            r = row_positions + row_offsets[i]
+            c = col_positions + col_offsets[i]
+            dr = r - np.floor(r)
+            dc = c - np.floor(c)
+            np.multiply(1 - dc, shifted(min_row, min_col), out=top)
+            top += np.multiply(dc, shifted(min_row, max_col), out=scratch)
+            np.multiply(1 - dc, shifted(max_row, min_col), out=bottom)
+            bottom += np.multiply(dc, shifted(max_row, max_col), out=scratch)
+            top *= 1 - dr
+            top += np.multiply(dr, bottom, out=scratch)
+            texture = top
+
+        # texture - center >= 0 is the same test as texture >= center for finite values
+        np.greater_equal(texture, gray_stack, out=is_set)
+        codes |= np.left_shift(is_set.view(np.uint8), i, out=bits)
+
+    n_bins = points + 2
+    bins = LBP_UNIFORM_LOOKUP[codes]
+    bins += (np.arange(n_images) * n_bins)[:, np.newaxis, np.newaxis]
+    hist = np.bincount(bins.ravel(), minlength=n_images * n_bins).reshape(n_images, n_bins)
+    return hist / (hist.sum(axis=1, keepdims=True) + 1e-6)
+
+
+def extractLBP(gray_uint8):
+    """Extract LBP features"""
+    if gray_uint8.size == 0 or gray_uint8.ndim < 2:
+        raise ValueError("Gambar kosong atau tidak valid untuk ekstraksi LBP.")
+    return extractLBPBatch(gray_uint8)[0]
+
+
+def extractColor(image_bgr, out=None):
+    """Extract color features
+
+    Normalized 256-bin histograms of the R, G and B channels, read straight
+    from the uint8 BGR image and written into out (768 float32 values).
+    """
+    if image_bgr.size == 0 or image_bgr.ndim < 3:
+        raise ValueError("Gambar kosong atau tidak valid untuk ekstraksi warna.")
+    if out is None:
+        out = np.empty(FEATURE_SIZES['COLOR'], dtype=np.float32)
+
+    for i, channel in enumerate((2, 1, 0)):
+        hist = cv2.calcHist([image_bgr], [channel], None, [256], [0, 256]).ravel()
+        np.divide(hist, hist.sum() + 1e-6, out=out[i * 256:(i + 1) * 256])
+    return out
+
+
+class PreprocessedImage:
+    """A resized uint8 BGR image; the grayscale version is converted on first use
+
+    COLOR reads the BGR channels directly, so only GLCM and LBP pay for the
+    gray conversion and nothing is converted to float until a feature needs it.
+    """
+    __slots__ = ('bgr', '_gray')
+
+    def __init__(self, image_bgr):
+        image_bgr.setflags(write=False)
+        self.bgr = image_bgr
+        self._gray = None
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            gray = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+            gray.setflags(write=False)
+            self._gray = gray
+        return self._gray
+
+
+def jpegSize(image_path):
+    """Return (width, height) from the SOF marker of a JPEG file, or None if it cannot be found"""
+    with open(image_path, 'rb') as file:
+        header = file.read(JPEG_HEADER_BYTES)
+    if header[:2] != b'\xff\xd8':
+        return None
+
+    position = 2
+    while position + 9 <= len(header):
+        if header[position] != 0xFF:
+            return None
+        marker = header[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if 0xD0 <= marker <= 0xD9 or marker == 0x01:
+            position += 2
+            continue
+        length = int.from_bytes(header[position + 2:position + 4], 'big')
+        # SOF0-SOF15 without DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(header[position + 5:position + 7], 'big')
+            width = int.from_bytes(header[position + 7:position + 9], 'big')
+            return (width, height) if width and height else None
+        position += 2 + length
+    return None
+
+
+def decodeScale(image_path, size=IMAGE_SIZE):
+    """Return the largest JPEG decode scale (1, 2, 4 or 8) that keeps both sides at least size
+
+    Formats other than JPEG, and JPEGs whose header cannot be read, decode
+    at full resolution (1).
+    """
+    if not image_path.lower().endswith(JPEG_EXTENSIONS):
+        return 1
+    try:
+        dimensions = jpegSize(image_path)
+    except OSError:
+        return 1
+    if dimensions is None:
+        return 1
+
+    shortest = min(dimensions)
+    for scale, _ in REDUCED_DECODE_FLAGS:
+        if -(-shortest // scale) >= max(size):
+            return scale
+    return 1
+
+
+def decodeImage(image_path, size=IMAGE_SIZE):
+    """Decode an image as BGR at the smallest JPEG scale that still covers size, or None"""
+    scale = decodeScale(image_path, size)
+    if scale > 1:
+        image = cv2.imread(image_path, dict(REDUCED_DECODE_FLAGS)[scale])
+        if image is not None:
+            return image
+    return cv2.imread(image_path)
+
+
+def preprocessImage(image_path):
+    """Load and resize an image into a PreprocessedImage
+
+    Large JPEGs are decoded at reduced resolution (see decodeScale) instead
+    of decoding every pixel only to resize them away.
+    """
+    image = decodeImage(image_path)
+    if image is None:
+        raise ValueError(f"Cannot load image from {image_path}. Check file path and integrity.")
+    return PreprocessedImage(cv2.resize(image, IMAGE_SIZE))
+
+
+class PreprocessCache:
+    """Bounded LRU cache of preprocessed images keyed by path, mtime and size"""
+
+    def __init__(self, max_items=16):
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, image_path):
+        """Return the PreprocessedImage for a file, decoding it only on a miss"""
+        stat = os.stat(image_path)
+        key = (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+
+        image = preprocessImage(image_path)
+
+        with self._lock:
+            self.misses += 1
+            self._items[key] = image
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return image
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+preprocess_cache = PreprocessCache()
+
+
+def loadImage(image_path, cache=preprocess_cache):
+    """Return the PreprocessedImage for a file, through the cache when given"""
+    if not os.path.isfile(image_path):
+        raise ValueError(f"Cannot load image from {image_path}. Check file path and integrity.")
+    return cache.get(image_path) if cache is not None else preprocessImage(image_path)
+
+
+def featuresFromImage(image, method_prefix):
+    """Extract a (1, n_features) feature row from an already preprocessed image"""
+    return featureMatrix([image], method_prefix)
+
+
+def featureMatrix(images, method_prefix, out=None):
+    """Extract an (N, n_features) float32 matrix for a list of preprocessed images
+
+    Rows are written in place into out when a preallocated matrix is given.
+    """
+    if method_prefix not in FEATURE_METHODS:
+        raise ValueError(f"Metode ekstraksi fitur '{method_prefix}' tidak dikenal.")
+    if not images:
+        raise ValueError(f"Tidak ada fitur yang diekstrak untuk metode {method_prefix}.")
+    if out is None:
+        out = np.empty((len(images), FEATURE_SIZES[method_prefix]), dtype=np.float32)
+
+    if method_prefix == 'GLCM':
+        out[:] = extractGLCMBatch(np.stack([image.gray for image in images]))
+    elif method_prefix == 'LBP':
+        out[:] = extractLBPBatch(np.stack([image.gray for image in images]))
+    else:
+        for row, image in enumerate(images):
+            extractColor(image.bgr, out[row])
+    return out
+
+
+def vegetationCoverage(image_bgr):
+    """Fraction of a downscaled BGR image whose colour looks like a leaf, green or diseased"""
+    # INTER_LINEAR reads a few pixels per output pixel; INTER_AREA would average all of them at 20x the cost
+    small = cv2.resize(image_bgr, PREFILTER_SIZE, interpolation=cv2.INTER_LINEAR)
+    mask = cv2.inRange(cv2.cvtColor(small, cv2.COLOR_BGR2HSV), VEGETATION_HSV_LOW, VEGETATION_HSV_HIGH)
+    return cv2.countNonZero(mask) / mask.size
+
+
+def perceptualHash(gray_uint8):
+    """64-bit difference hash (dHash) of a grayscale image
+
+    The image is shrunk to 9x8 and each bit tells whether a pixel is
+    brighter than its right neighbour, so small changes flip few bits.
+    """
+    small = cv2.resize(gray_uint8, (PHASH_SIZE + 1, PHASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+@lru_cache(maxsize=4096)
+def _hashFile(image_path, mtime_ns, size):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(image_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def contentHash(image_path):
+    """Hash of the file contents, remembered per path, mtime and size"""
+    if not os.path.isfile(image_path):
+        raise ValueError(f"Cannot load image from {image_path}. Check file path and integrity.")
+    stat = os.stat(image_path)
+    return _hashFile(os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
+
+
+def extractFeatures(image_path, method_prefix, cache=preprocess_cache, store=None):
+    """Extract a (1, n_features) feature row from an image file
+
+    With a database.FeatureStore the row is looked up by content hash first
+    and the image is only decoded on a miss.
+    """
+    if method_prefix not in FEATURE_METHODS:
+        raise ValueError(f"Metode ekstraksi fitur '{method_prefix}' tidak dikenal.")
+    if store is None:
+        return featuresFromImage(loadImage(image_path, cache), method_prefix)
+
+    content_hash = contentHash(image_path)
+    version = EXTRACTOR_VERSIONS[method_prefix]
+    vector = store.getMany([content_hash], method_prefix, version).get(content_hash)
+    if vector is not None and vector.size == FEATURE_SIZES[method_prefix]:
+        return vector.reshape(1, -1)
+
+    row = featuresFromImage(loadImage(image_path, cache), method_prefix)
+    store.putMany([(content_hash, row[0])], method_prefix, version)
+    return row
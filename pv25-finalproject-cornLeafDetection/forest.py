@@ -0,0 +1,106 @@
+import numpy as np
+
+
+class CompiledForest:
+    """A RandomForestClassifier flattened into contiguous NumPy arrays
+
+    All trees are stored back to back. Leaves point to themselves and have an
+    infinite threshold, so predict_proba can move every (sample, tree) pair one
+    level down per step without checking which ones already reached a leaf.
+    """
+
+    def __init__(self, model):
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        if model.n_outputs_ != 1:
+            raise ValueError("Only single-output forests can be compiled.")
+
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+        node_count = int(offsets[-1])
+
+        self.classes_ = model.classes_
+        self.n_features_in_ = model.n_features_in_
+        self.n_trees = len(trees)
+        self.max_depth = max(tree.max_depth for tree in trees)
+        self.roots = offsets[:-1].astype(np.intp)
+
+        self.feature = np.zeros(node_count, dtype=np.intp)
+        self.threshold = np.full(node_count, np.inf)
+        self.left = np.arange(node_count, dtype=np.intp)
+        self.right = np.arange(node_count, dtype=np.intp)
+        self.missing_left = np.zeros(node_count, dtype=bool)
+        self.values = np.zeros((node_count, len(self.classes_)))
+
+        for tree, start in zip(trees, offsets[:-1]):
+            end = start + tree.node_count
+            split = tree.children_left != -1
+            nodes = np.arange(start, end)[split]
+
+            self.feature[nodes] = tree.feature[split]
+            self.threshold[nodes] = tree.threshold[split]
+            self.left[nodes] = tree.children_left[split] + start
+            self.right[nodes] = tree.children_right[split] + start
+            if hasattr(tree, 'missing_go_to_left'):
+                self.missing_left[nodes] = tree.missing_go_to_left[split].astype(bool)
+
+            # Same normalization as DecisionTreeClassifier.predict_proba
+            value = tree.value[:, 0, :len(self.classes_)]
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            self.values[start:end] = value / normalizer
+
+    def apply(self, X):
+        """Return the leaf index reached in every tree, shape (n_samples, n_trees)"""
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+        nodes = np.repeat(self.roots[np.newaxis, :], X.shape[0], axis=0)
+
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[nodes]]
+            go_left = (x <= self.threshold[nodes]) | (np.isnan(x) & self.missing_left[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_proba(self, X):
+        """Class probabilities, matching RandomForestClassifier.predict_proba"""
+        leaf_values = self.values[self.apply(X)]
+        proba = np.zeros((leaf_values.shape[0], leaf_values.shape[2]))
+        for tree_index in range(self.n_trees):
+            proba += leaf_values[:, tree_index]
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def verificationSamples(model, n_samples=64, seed=0):
+    """Build rows that land on both sides of the split thresholds used by the forest"""
+    rng = np.random.default_rng(seed)
+    thresholds = {}
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        split = tree.children_left != -1
+        for feature, threshold in zip(tree.feature[split], tree.threshold[split]):
+            thresholds.setdefault(feature, []).append(threshold)
+
+    X = np.zeros((n_samples, model.n_features_in_))
+    for feature, values in thresholds.items():
+        values = np.asarray(values)
+        jitter = rng.uniform(-1e-3, 1e-3, n_samples) * np.maximum(np.abs(values).max(), 1.0)
+        X[:, feature] = rng.choice(values, n_samples) + jitter
+    return X
+
+
+def compileForest(model, X_check=None):
+    """Compile a fitted forest and verify it against the stock predict_proba
+
+    Raises ValueError if the compiled probabilities are not identical to
+    model.predict_proba on the verification rows.
+    """
+    compiled = CompiledForest(model)
+    if X_check is None:
+        X_check = verificationSamples(model)
+
+    if not np.array_equal(compiled.predict_proba(X_check), model.predict_proba(X_check)):
+        raise ValueError("Compiled forest does not match predict_proba.")
+    return compiled
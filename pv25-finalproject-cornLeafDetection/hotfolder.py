@@ -0,0 +1,205 @@
+"""Watch a folder and classify new images as they arrive.
+
+Usage:
+    python hotfolder.py "sync/kamera" --model COLOR_RF
+    python hotfolder.py "sync/kamera" --existing --poll 2 --max-pending 128
+
+A file is only picked up once its size and modification time have not
+changed for the settle time, so images still being copied are skipped
+until the write finishes. At most max-pending accepted files wait for
+inference; further files stay in the folder and are picked up by a later
+scan, which keeps memory bounded when the camera outpaces the model.
+"""
+import os
+import sys
+import time
+import queue
+import argparse
+import threading
+
+import features
+import models
+import database
+from engine import PredictionEngine, Prediction, BACKENDS
+
+HOTFOLDER_SETTLE_SECONDS = 1.0
+HOTFOLDER_POLL_SECONDS = 1.0
+HOTFOLDER_BATCH_SIZE = 8
+HOTFOLDER_MAX_PENDING = 64
+
+
+class FolderScanner:
+    """Report new image files of a folder once their writes have finished
+
+    Every scan records the size and mtime of the files not handed out yet;
+    a file is ready when both have stayed the same for settle seconds.
+    Files already in the folder when the scanner is created are ignored
+    unless include_existing is set.
+    """
+
+    def __init__(self, directory, settle=HOTFOLDER_SETTLE_SECONDS, include_existing=False):
+        self.directory = directory
+        self.settle = settle
+        self.seen = set()
+        self.candidates = {}
+        if not include_existing:
+            self.seen.update(self._imageFiles())
+
+    def _imageFiles(self):
+        with os.scandir(self.directory) as entries:
+            return {os.path.abspath(entry.path) for entry in entries
+                    if entry.is_file() and entry.name.lower().endswith(features.IMAGE_EXTENSIONS)}
+
+    def scan(self, now=None):
+        """Return the sorted paths that are complete but not accepted yet"""
+        now = time.monotonic() if now is None else now
+        ready = []
+        present = set()
+
+        for path in self._imageFiles() - self.seen:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            present.add(path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+            previous = self.candidates.get(path)
+            if previous is None or previous[0] != signature:
+                self.candidates[path] = (signature, now)
+            elif stat.st_size > 0 and now - previous[1] >= self.settle:
+                ready.append(path)
+
+        for path in set(self.candidates) - present:
+            del self.candidates[path]
+        return sorted(ready)
+
+    def accept(self, paths):
+        """Mark paths as handed out so later scans skip them"""
+        for path in paths:
+            self.seen.add(path)
+            self.candidates.pop(path, None)
+
+    def hasCandidates(self):
+        """Check whether some new files are still being written or waiting for room"""
+        return bool(self.candidates)
+
+
+def _hotFolderNote(prediction):
+    """The notes value of a prediction row written by the hot folder"""
+    reused = database.reuseNote(prediction)
+    return f'hot folder ({reused})' if reused else 'hot folder'
+
+
+def _classifyPending(engine, model_name_prefix, pending, writer, batch_size, stop, on_batch):
+    """Classify queued paths in micro-batches until stop is set and the queue is empty"""
+    while not (stop.is_set() and pending.empty()):
+        try:
+            image_paths = [pending.get(timeout=0.2)]
+        except queue.Empty:
+            continue
+        while len(image_paths) < batch_size:
+            try:
+                image_paths.append(pending.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            predictions = engine.predict_batch(image_paths, model_name_prefix)
+        except Exception as e:
+            predictions = [Prediction(image_path, None, None, None, str(e)) for image_path in image_paths]
+
+        rows = [database.predictionRow(prediction, model_name_prefix, _hotFolderNote(prediction))
+                for prediction in predictions if prediction.error is None]
+
+        queued = pending.qsize()
+        done = None if on_batch is None else lambda ids, predictions=predictions: on_batch(predictions, queued)
+        if rows:
+            writer.submit(rows, done)
+        elif done is not None:
+            done([])
+
+
+def watchFolder(engine, directory, model_name_prefix, db_path=database.DB_PATH, poll=HOTFOLDER_POLL_SECONDS,
+                settle=HOTFOLDER_SETTLE_SECONDS, batch_size=HOTFOLDER_BATCH_SIZE, max_pending=HOTFOLDER_MAX_PENDING,
+                include_existing=False, stop=None, on_batch=None):
+    """Poll directory and classify new images in the background until stop is set
+
+    The rows of each micro-batch go through a PredictionWriter and
+    on_batch(predictions, queued) is called once they are committed.
+    Files accepted before stop is set are still classified and committed
+    before returning.
+    """
+    scanner = FolderScanner(directory, settle, include_existing)
+    pending = queue.Queue(maxsize=max_pending)
+    stop = stop or threading.Event()
+    finished = threading.Event()
+    writer = database.PredictionWriter(db_path)
+    classifier = threading.Thread(target=_classifyPending, name='hotfolder-classifier',
+                                  args=(engine, model_name_prefix, pending, writer, batch_size, finished,
+                                        on_batch))
+    classifier.start()
+    try:
+        while not stop.is_set():
+            ready = scanner.scan()
+            accepted = ready[:max_pending - pending.qsize()]
+            scanner.accept(accepted)
+            for path in accepted:
+                pending.put(path)
+            stop.wait(poll)
+    finally:
+        finished.set()
+        classifier.join()
+        writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Classify images as they are dropped into a folder.')
+    parser.add_argument('directory', help='folder to watch')
+    parser.add_argument('--model', default='COLOR_RF',
+                        choices=models.MODEL_NAMES + [models.ENSEMBLE_NAME, models.CASCADE_NAME])
+    parser.add_argument('--db', default=database.DB_PATH, help='SQLite database (default: corn.db)')
+    parser.add_argument('--backend', default='sklearn', choices=BACKENDS, help='forest inference backend')
+    parser.add_argument('--poll', type=float, default=HOTFOLDER_POLL_SECONDS, help='seconds between folder scans')
+    parser.add_argument('--settle', type=float, default=HOTFOLDER_SETTLE_SECONDS,
+                        help='seconds a file must stay unchanged before it is classified')
+    parser.add_argument('--batch-size', type=int, default=HOTFOLDER_BATCH_SIZE, help='images per predict_batch call')
+    parser.add_argument('--max-pending', type=int, default=HOTFOLDER_MAX_PENDING,
+                        help='accepted files waiting for inference before new files are left in the folder')
+    parser.add_argument('--existing', action='store_true', help='also classify the images already in the folder')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+    if not any(os.path.exists(models.modelPath(name)) for name in models.memberNames(args.model)):
+        parser.error(f"model file not found for {args.model} in {models.MODEL_DIRECTORY}")
+
+    feature_store = database.FeatureStore(args.db)
+    history = database.PredictionHistory(args.db)
+    engine = PredictionEngine(models.MODEL_DIRECTORY, args.backend, feature_store, history,
+                              min_vegetation=features.PREFILTER_MIN_COVERAGE)
+    for name, error in engine.loadAvailable(models.memberNames(args.model)).items():
+        print(f"Error loading {name}: {error}", file=sys.stderr)
+
+    def report(predictions, queued):
+        for prediction in predictions:
+            if prediction.error is not None:
+                print(f"Error classifying {prediction.image_path}: {prediction.error}", file=sys.stderr)
+            else:
+                print(f"{os.path.basename(prediction.image_path)}: {prediction.result} "
+                      f"({prediction.confidence:.2%}), {queued} waiting")
+
+    print(f"Watching {args.directory} with {args.model}, Ctrl+C to stop...")
+    try:
+        watchFolder(engine, args.directory, args.model, args.db, args.poll, args.settle, args.batch_size,
+                    args.max_pending, args.existing, on_batch=report)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+        feature_store.close()
+        history.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
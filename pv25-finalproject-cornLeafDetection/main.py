@@ -1,15 +1,22 @@
 import sys
 import os
 import sqlite3
-import joblib 
+from collections import Counter
 import cv2
-import numpy as np
-from datetime import datetime
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 from PyQt5 import uic
-from skimage.feature import graycomatrix, graycoprops, local_binary_pattern
+
+import features
+import models
+import database
+import tiles
+import video
+import hotfolder
+from engine import PredictionEngine
+from workers import PredictionWorker, TileWorker, VideoWorker, WriteNotifier, FilterWorker, ModelLoader
+from tablemodel import PredictionTableModel, TABLE_PAGE_SIZE
 
 import pandas as pd
 from reportlab.lib.pagesizes import letter
@@ -17,6 +24,18 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import colors
 
+TABLE_CELL_PADDING = 24  # horizontal margins of a table cell around its text
+FILTER_DEBOUNCE_MS = 250
+QUEUE_MAX_FINISHED = 200  # done or failed items kept in the queue list while watching a folder
+
+MODEL_STATE_TEXT = {
+    'unloaded': 'belum dimuat',
+    'loading': 'memuat...',
+    'ready': 'siap',
+    'missing': 'tidak ada',
+    'error': 'gagal'
+}
+
 class CornDetectionApp(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -29,7 +48,16 @@ class CornDetectionApp(QMainWindow):
         uic.loadUi(ui_file_path, self)
         
         self.current_image_path = None
-        self.models = {}
+        self.prediction_worker = None
+        self.tile_worker = None
+        self.video_worker = None
+        self.filter_worker = None
+        self.filter_pending = False
+        self.feature_store = None
+        self.folder_watcher = None
+        self.folder_scanner = None
+        self.watch_model_name = None
+        self.queue_counts = Counter()
 
         self.setupUI()
         self.loadModels()
@@ -42,20 +70,22 @@ class CornDetectionApp(QMainWindow):
         self.setWindowIcon(self.style().standardIcon(QStyle.SP_ComputerIcon)) 
         
         self.modelCombo.clear()
-        models = [
+        cascade_order, _ = models.loadCascadeConfig(models.MODEL_DIRECTORY)
+        model_items = [
             'COLOR_RF (Akurasi: 0.8247)',
             'LBP_RF (Akurasi: 0.7731)',
-            'GLCM_RF (Akurasi: 0.7325)'
+            'GLCM_RF (Akurasi: 0.7325)',
+            f'{models.ENSEMBLE_NAME} (Semua Model, Soft Voting)',
+            f'{models.CASCADE_NAME} ({" → ".join(models.featureMethod(name) for name in cascade_order)})'
         ]
-        self.modelCombo.addItems(models)
+        self.modelCombo.addItems(model_items)
+        
+        self.backendCombo.clear()
+        self.backendCombo.addItems(['sklearn (bawaan)', 'compiled (NumPy)'])
         
         self.filterCombo.clear()
         self.filterCombo.addItems(['Semua', 'Daun Jagung Baik', 'Daun Jagung Sakit', 'Bukan Daun Jagung'])
         
-        self.table.setColumnCount(6)
-        headers = ['ID', 'Nama File', 'Hasil Prediksi', 'Model', 'Tanggal', 'Confidence']
-        self.table.setHorizontalHeaderLabels(headers)
-        
         self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.table.setAlternatingRowColors(True)
         
@@ -63,12 +93,6 @@ class CornDetectionApp(QMainWindow):
         self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed) 
         self.table.verticalHeader().setDefaultSectionSize(40) 
         
-        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents) 
-        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)           
-        self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeToContents) 
-        self.table.horizontalHeader().setSectionResizeMode(3, QHeaderView.ResizeToContents) 
-        self.table.horizontalHeader().setSectionResizeMode(4, QHeaderView.ResizeToContents) 
-        self.table.horizontalHeader().setSectionResizeMode(5, QHeaderView.ResizeToContents) 
         self.table.horizontalHeader().setVisible(True)
         self.table.setMinimumHeight(250) 
         
@@ -80,16 +104,40 @@ class CornDetectionApp(QMainWindow):
         
         self.btnPredict.setEnabled(False)
         
+        self.setAcceptDrops(True)
+        self.queueProgress.setValue(0)
+        
+        self.cacheLabel = QLabel()
+        self.statusBar().addPermanentWidget(self.cacheLabel)
+        
+        self.folderScanTimer = QTimer(self)
+        self.folderScanTimer.setSingleShot(True)
+        self.filterTimer = QTimer(self)
+        self.filterTimer.setSingleShot(True)
+        self.filterTimer.setInterval(FILTER_DEBOUNCE_MS)
+        self.updateCacheStatus()
+        
     def connectSignals(self):
         """Connect UI signals to methods"""
         self.btnSelectImage.clicked.connect(self.selectImage)
+        self.btnSelectVideo.clicked.connect(self.selectVideo)
         self.btnPredict.clicked.connect(self.predictImage)
         self.btnRefresh.clicked.connect(self.loadTableData)
         self.btnDelete.clicked.connect(self.deleteRecord)
         self.btnExportCSV.clicked.connect(self.exportToCSV)
         self.btnExportPDF.clicked.connect(self.exportToPDF)
         
-        self.searchInput.textChanged.connect(self.filterResults)
+        self.backendCombo.currentTextChanged.connect(self.changeBackend)
+        
+        self.btnAddQueue.clicked.connect(self.addToQueue)
+        self.btnWatchFolder.clicked.connect(self.toggleWatchFolder)
+        self.folderScanTimer.timeout.connect(self.scanWatchedFolder)
+        self.btnStartQueue.clicked.connect(self.startQueue)
+        self.btnCancelQueue.clicked.connect(self.cancelQueue)
+        self.btnClearQueue.clicked.connect(self.clearQueue)
+        
+        self.searchInput.textChanged.connect(self.filterTimer.start)
+        self.filterTimer.timeout.connect(self.filterResults)
         self.filterCombo.currentTextChanged.connect(self.filterResults)
         
         self.actionOpenImage.triggered.connect(self.selectImage) 
@@ -103,57 +151,78 @@ class CornDetectionApp(QMainWindow):
 
     def initDatabase(self):
         """Initialize SQLite database"""
-        self.db_path = 'corn.db'
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS predictions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                filename TEXT NOT NULL,
-                result TEXT NOT NULL,
-                model_used TEXT NOT NULL,
-                prediction_date TEXT NOT NULL,
-                confidence REAL,
-                notes TEXT
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        self.db_path = database.DB_PATH
+        self.database = database.PredictionDatabase(self.db_path)
+        # Own connection, so a slow filter query does not block the table's paging
+        self.filter_database = database.PredictionDatabase(self.db_path)
+        self.writer = database.PredictionWriter(self.db_path)
+        self.write_notifier = WriteNotifier(self)
+        self.write_notifier.rowsWritten.connect(self.onRowsWritten)
+
+        self.table_model = PredictionTableModel(self.database, self)
+        self.table.setModel(self.table_model)
+        # Header sections only exist once the model is set. Sized by loadTableData and widened per
+        # new row in fitTableColumns; ResizeToContents would measure every row again on each change
+        header = self.table.horizontalHeader()
+        for j in range(self.table_model.columnCount()):
+            header.setSectionResizeMode(j, QHeaderView.Stretch if j == 1 else QHeaderView.Interactive)
         self.loadTableData() 
         
     def loadModels(self):
-        """Load machine learning models"""
-        self.models = {}
-        model_file_names = [
-            'model_COLOR_RF.pkl',
-            'model_LBP_RF.pkl', 
-            'model_GLCM_RF.pkl'
-        ]
+        """Find the model files; they are loaded lazily or by the background loader"""
+        self.model_directory = models.MODEL_DIRECTORY
+        try:
+            self.feature_store = database.FeatureStore(database.DB_PATH)
+            self.history = database.PredictionHistory(database.DB_PATH)
+        except sqlite3.Error as e:
+            print(f"Feature store unavailable: {e}")
+            self.feature_store = None
+            self.history = None
+        self.engine = PredictionEngine(self.model_directory, feature_store=self.feature_store, history=self.history,
+                                       min_vegetation=features.PREFILTER_MIN_COVERAGE)
+        self.model_loader = None
+        
+        for model_name_prefix, state in self.engine.states.items():
+            if state == 'missing':
+                print(f"Model file not found: {models.modelPath(model_name_prefix, self.model_directory)}")
+        
+        if all(state == 'missing' for state in self.engine.states.values()):
+            QMessageBox.warning(self, 'Warning', 'Tidak ada model yang ditemukan!\nPastikan file model (.pkl) ada di direktori yang benar.')
         
-        self.model_directory = os.path.dirname(__file__) 
-        
-        for model_file_name in model_file_names:
-            model_full_path = os.path.join(self.model_directory, model_file_name)
-            if os.path.exists(model_full_path):
-                try:
-                    self.models[model_full_path] = joblib.load(model_full_path)
-                    print(f"Loaded model: {model_full_path}")
-                except Exception as e:
-                    print(f"Error loading {model_full_path}: {e}")
-                    QMessageBox.warning(self, 'Warning', f"Gagal memuat model {model_file_name}: {e}")
-            else:
-                print(f"Model file not found: {model_full_path}")
+        self.modelStatusLabel = QLabel()
+        self.statusBar().addPermanentWidget(self.modelStatusLabel)
+        self.updateModelStatus()
         
-        if not self.models:
-            QMessageBox.warning(self, 'Warning', 'Tidak ada model yang ditemukan!\nPastikan file model (.pkl) ada di direktori yang benar.')
+        QTimer.singleShot(0, self.startModelLoader)
+
+    def startModelLoader(self):
+        """Load and warm up the models on a background thread"""
+        self.model_loader = ModelLoader(self.engine, self)
+        self.model_loader.modelStateChanged.connect(self.onModelStateChanged)
+        self.model_loader.modelFailed.connect(self.onModelFailed)
+        self.model_loader.start()
+
+    def updateModelStatus(self):
+        """Show the load state of every model in the status bar"""
+        self.modelStatusLabel.setText(' | '.join(
+            f'{name}: {MODEL_STATE_TEXT[state]}' for name, state in self.engine.states.items()
+        ))
+
+    def onModelStateChanged(self, model_name_prefix, state):
+        if state == 'ready':
+            print(f"Loaded model: {models.modelPath(model_name_prefix, self.model_directory)}")
+        self.updateModelStatus()
+
+    def onModelFailed(self, model_name_prefix, message):
+        model_file_name = os.path.basename(models.modelPath(model_name_prefix))
+        print(f"Error loading {model_file_name}: {message}")
+        QMessageBox.warning(self, 'Warning', f"Gagal memuat model {model_file_name}: {message}")
             
     def selectImage(self):
         """Select image file"""
         file_path, _ = QFileDialog.getOpenFileName(
             self, 'Pilih Gambar Jagung', '', 
-            'Image Files (*.png *.jpg *.jpeg *.bmp *.tiff)'
+            'Image Files (*.png *.jpg *.jpeg *.bmp *.tif *.tiff)'
         )
         
         if file_path:
@@ -170,219 +239,487 @@ class CornDetectionApp(QMainWindow):
             self.btnPredict.setEnabled(True)
             self.statusBar().showMessage(f'Gambar dipilih: {os.path.basename(file_path)}')
 
-    def _extract_glcm_gui(self, gray_img_float):
-        """Extract GLCM features"""
-        gray_scaled_uint8 = (gray_img_float * 255).astype(np.uint8) 
-        if gray_scaled_uint8.size == 0 or gray_scaled_uint8.ndim < 2:
-            raise ValueError("Gambar kosong atau tidak valid untuk ekstraksi GLCM.")
-        glcm = graycomatrix(gray_scaled_uint8, distances=[1], angles=[0], symmetric=True, normed=True)
-        return [
-            graycoprops(glcm, 'contrast')[0, 0],
-            graycoprops(glcm, 'correlation')[0, 0],
-            graycoprops(glcm, 'energy')[0, 0],
-            graycoprops(glcm, 'homogeneity')[0, 0]
-        ] 
-
-    def _extract_lbp_gui(self, gray_img_float):
-        """Extract LBP features"""
-        if gray_img_float.size == 0 or gray_img_float.ndim < 2:
-            raise ValueError("Gambar kosong atau tidak valid untuk ekstraksi LBP.")
-        
-        radius = 1
-        points = 8 
-        lbp = local_binary_pattern(gray_img_float, points, radius, method='uniform')
-        hist, _ = np.histogram(lbp.ravel(), bins=np.arange(0, points + 3), range=(0, points + 2))
-        return (hist / (hist.sum() + 1e-6)).tolist() 
-
-    def _extract_color_gui(self, image_rgb_float):
-        """Extract color features"""
-        if image_rgb_float.size == 0 or image_rgb_float.ndim < 3:
-            raise ValueError("Gambar kosong atau tidak valid untuk ekstraksi warna.")
-            
-        chans = cv2.split((image_rgb_float * 255).astype(np.uint8))
-        features = []
-        for chan in chans:
-            hist = cv2.calcHist([chan], [0], None, [256], [0, 256]).flatten()
-            features.extend(hist / (hist.sum() + 1e-6))
-        return features 
-
-    def extractFeatures(self, image_path, method_prefix):
-        """Extract features from image based on method"""
-        try:
-            image = cv2.imread(image_path)
-            if image is None:
-                raise ValueError(f"Cannot load image from {image_path}. Check file path and integrity.")
+    def selectedModelName(self):
+        """Return the model name prefix selected in modelCombo"""
+        return self.modelCombo.currentText().split(' (')[0]
 
-            image_resized = cv2.resize(image, (256, 256))
+    def checkModelAvailable(self, model_name_prefix):
+        """Return whether a model selection can be used, warning the user if it cannot"""
+        if self.engine.isAvailable(model_name_prefix):
+            return True
+        model_full_path = models.modelPath(model_name_prefix, self.model_directory)
+        QMessageBox.warning(self, 'Error', f'Model {model_name_prefix} ({model_full_path}) tidak tersedia atau gagal dimuat!')
+        return False
 
-            image_rgb_float = cv2.cvtColor(image_resized, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0
-            image_gray_float = cv2.cvtColor(image_resized, cv2.COLOR_BGR2GRAY).astype(np.float32) / 255.0
+    def queueModelName(self):
+        """Return the model the queue runs with: the one chosen for the watched folder while one is watched"""
+        return self.watch_model_name if self.folder_scanner is not None else self.selectedModelName()
 
-            features = []
+    def changeBackend(self, text):
+        """Switch the forest inference backend used for the next predictions"""
+        backend = text.split(' (')[0]
+        self.engine.setBackend(backend)
+        self.statusBar().showMessage(f'Backend inferensi: {backend}')
 
-            if method_prefix == 'GLCM':
-                features.extend(self._extract_glcm_gui(image_gray_float))
-            elif method_prefix == 'LBP':
-                features.extend(self._extract_lbp_gui(image_gray_float))
-            elif method_prefix == 'COLOR':
-                features.extend(self._extract_color_gui(image_rgb_float))
-            else:
-                QMessageBox.warning(self, 'Warning', f"Metode ekstraksi fitur '{method_prefix}' tidak dikenal.")
-                return None
-            
-            print(f"DEBUG: Extracted {len(features)} features for method {method_prefix}.")
-            
-            if not features:
-                raise ValueError(f"Tidak ada fitur yang diekstrak untuk metode {method_prefix}.")
-            
-            return np.array(features).reshape(1, -1)
-            
-        except Exception as e:
-            print(f"Error extracting features: {e}")
-            QMessageBox.critical(self, 'Error', f'Gagal mengekstrak fitur dari gambar:\n{str(e)}')
-            return None
-            
     def predictImage(self):
-        """Predict image using selected model"""
+        """Predict the selected image on the background queue"""
         if not hasattr(self, 'current_image_path') or not self.current_image_path:
             QMessageBox.warning(self, 'Warning', 'Pilih gambar terlebih dahulu!')
             return
             
-        selected_text = self.modelCombo.currentText()
-        model_name_prefix = selected_text.split(' (')[0] 
-        feature_method_type = model_name_prefix.split('_')[0] 
+        if self.tiledCheck.isChecked():
+            self.startTiles()
+            return
+            
+        self.enqueueImages([self.current_image_path])
+        self.startQueue()
+
+    def startTiles(self):
+        """Classify the selected image tile by tile on a background thread"""
+        if self.tile_worker is not None:
+            return
+            
+        model_name_prefix = self.selectedModelName()
         
-        model_full_path = os.path.join(self.model_directory, f"model_{model_name_prefix}.pkl")
+        if not self.checkModelAvailable(model_name_prefix):
+            return
+            
+        self.tile_worker = TileWorker(self.current_image_path, self.engine, model_name_prefix, self)
+        self.tile_worker.progressChanged.connect(self.onQueueProgress)
+        self.tile_worker.tilesFinished.connect(self.onTilesFinished)
+        self.tile_worker.tilesFailed.connect(self.onTilesFailed)
+        self.tile_worker.finished.connect(self.onTileWorkerFinished)
         
-        if not os.path.exists(model_full_path) or model_full_path not in self.models:
-            QMessageBox.warning(self, 'Error', f'Model {model_name_prefix} ({model_full_path}) tidak tersedia atau gagal dimuat!')
+        self.queueProgress.setRange(0, 0)
+        self.btnPredict.setEnabled(False)
+        self.tile_worker.start()
+        self.statusBar().showMessage(
+            f'Memproses ubin {os.path.basename(self.current_image_path)} dengan {model_name_prefix}...')
+
+    def showHeatmap(self, result):
+        """Draw the per-tile heatmap of a tiled prediction in imageLabel"""
+        overlay = cv2.cvtColor(tiles.heatmapOverlay(result), cv2.COLOR_BGR2RGB)
+        height, width = overlay.shape[:2]
+        image = QImage(overlay.data, width, height, overlay.strides[0], QImage.Format_RGB888).copy()
+        pixmap = QPixmap.fromImage(image)
+        self.imageLabel.setPixmap(pixmap.scaled(self.imageLabel.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+
+    def onTilesFinished(self, result, processing_time):
+        model_name_prefix = self.tile_worker.model_name_prefix
+        _, result_text, confidence = tiles.dominantResult(result)
+        fractions = ', '.join(f'{name} {fraction:.0%}' for name, fraction in
+                              sorted(result.area_fractions.items(), key=lambda item: -item[1]))
+        
+        self.showHeatmap(result)
+        self.resultLabel.setText(result_text)
+        self.confidenceLabel.setText(f'{confidence:.2%}')
+        self.processingTimeLabel.setText(f'{processing_time:.3f} detik')
+        
+        if not result.complete:
+            self.statusBar().showMessage(f'Prediksi ubin dibatalkan, hasil sebagian tidak disimpan: {fractions}')
             return
             
-        try:
-            start_time = datetime.now()
+        self.saveToDatabase({
+            'filename': os.path.basename(result.image_path),
+            'result': result_text,
+            'model_used': model_name_prefix,
+            'confidence': confidence,
+            'stage': 'TILED',
+            'notes': f'{result.labels.size} ubin: {fractions}',
+            'area_fractions': result.area_fractions
+        })
+        
+        self.statusBar().showMessage(f'Prediksi ubin selesai: {fractions}')
+        self.updateModelStatus()
+
+    def selectVideo(self):
+        """Select a video file and classify its frames, or stop the running video"""
+        if self.video_worker is not None:
+            self.video_worker.cancel()
+            self.statusBar().showMessage('Menghentikan video...')
+            return
             
-            features = self.extractFeatures(self.current_image_path, feature_method_type) 
-            if features is None:
-                return 
-                
-            model = self.models[model_full_path]
-            prediction_numeric = model.predict(features)[0] 
+        extensions = ' '.join(f'*{extension}' for extension in video.VIDEO_EXTENSIONS)
+        file_path, _ = QFileDialog.getOpenFileName(self, 'Pilih Video Lahan', '', f'Video Files ({extensions})')
+        if file_path:
+            self.startVideo(file_path)
+
+    def startVideo(self, video_path):
+        """Classify the frames of a video file on a background thread"""
+        model_name_prefix = self.selectedModelName()
+        
+        if not self.checkModelAvailable(model_name_prefix):
+            return
             
-            confidence = 0.0
-            if hasattr(model, 'predict_proba'):
-                try:
-                    prob = model.predict_proba(features)[0]
-                    confidence = np.max(prob)
-                except Exception as e:
-                    print(f"Warning: Could not get probability for model {model_name_prefix}: {e}")
-                    
-            end_time = datetime.now()
-            processing_time = (end_time - start_time).total_seconds()
+        self.video_worker = VideoWorker(video_path, self.engine, model_name_prefix, self)
+        self.video_worker.progressChanged.connect(self.onQueueProgress)
+        self.video_worker.videoFinished.connect(self.onVideoFinished)
+        self.video_worker.videoFailed.connect(self.onVideoFailed)
+        self.video_worker.finished.connect(self.onVideoWorkerFinished)
+        
+        self.queueProgress.setRange(0, 0)
+        self.btnSelectVideo.setText('Hentikan Video')
+        self.video_worker.start()
+        self.statusBar().showMessage(f'Memproses video {os.path.basename(video_path)} dengan {model_name_prefix}...')
+
+    def onVideoFinished(self, result):
+        model_name_prefix = self.video_worker.model_name_prefix
+        longest = max(result.segments, key=lambda segment: segment.end - segment.start)
+        fps = result.frames_read / result.elapsed if result.elapsed > 0 else 0.0
+        
+        self.resultLabel.setText(f'{longest.result} ({len(result.segments)} segmen)')
+        self.confidenceLabel.setText(f'{longest.confidence:.2%}')
+        self.processingTimeLabel.setText(f'{result.elapsed:.3f} detik ({fps:.1f} fps)')
+        
+        self.writer.submit(video.segmentRows(result, model_name_prefix), self.write_notifier.rowsWritten.emit)
+        
+        self.statusBar().showMessage(
+            f'Video selesai: {len(result.segments)} segmen, {result.frames_classified}/{result.frames_read} '
+            f'frame diklasifikasikan, {fps:.1f} fps')
+        self.updateModelStatus()
+
+    def onVideoFailed(self, message):
+        self.statusBar().showMessage('Prediksi video gagal')
+        QMessageBox.warning(self, 'Error', f'Prediksi video gagal: {message}')
+
+    def onVideoWorkerFinished(self):
+        self.video_worker.deleteLater()
+        self.video_worker = None
+        self.queueProgress.setRange(0, 1)
+        self.queueProgress.setValue(0)
+        self.btnSelectVideo.setText('Klasifikasi Video')
+
+    def onTilesFailed(self, message):
+        self.statusBar().showMessage('Prediksi ubin gagal')
+        QMessageBox.warning(self, 'Error', f'Prediksi ubin gagal: {message}')
+
+    def onTileWorkerFinished(self):
+        self.tile_worker.deleteLater()
+        self.tile_worker = None
+        self.queueProgress.setRange(0, 1)
+        self.queueProgress.setValue(0)
+        self.btnPredict.setEnabled(self.current_image_path is not None)
+
+    def addToQueue(self):
+        """Select several images and add them to the prediction queue"""
+        file_paths, _ = QFileDialog.getOpenFileNames(
+            self, 'Pilih Gambar Jagung', '', 
+            'Image Files (*.png *.jpg *.jpeg *.bmp *.tiff)'
+        )
+        
+        if file_paths:
+            self.enqueueImages(file_paths)
+
+    def enqueueImages(self, file_paths):
+        """Add image files to the prediction queue"""
+        for file_path in file_paths:
+            item = QListWidgetItem()
+            item.setData(Qt.UserRole, file_path)
+            self.queueList.addItem(item)
+            self._setQueueStatus(self.queueList.count() - 1, 'pending', 'Menunggu')
+        
+        self.updateQueueButtons()
+        self.statusBar().showMessage(f'{len(file_paths)} gambar ditambahkan ke antrian')
+
+    def toggleWatchFolder(self):
+        """Start or stop classifying images dropped into a folder"""
+        if self.folder_scanner is not None:
+            self.folder_watcher.deleteLater()
+            self.folder_watcher = None
+            self.folder_scanner = None
+            self.watch_model_name = None
+            self.folderScanTimer.stop()
+            self.btnWatchFolder.setText('Pantau Folder')
+            self.statusBar().showMessage('Pemantauan folder dihentikan')
+            return
             
-            original_class_labels_map = {
-                0: 'Bukan_Jagung',
-                1: 'Corn_Cercospora_leaf_spot Gray_leaf_spot',
-                2: 'Corn_Northern_Leaf_Blight',
-                3: 'corn_healthy'
-            }
+        model_name_prefix = self.selectedModelName()
+        if not self.checkModelAvailable(model_name_prefix):
+            return
             
-            predicted_original_label = original_class_labels_map.get(prediction_numeric, 'UNKNOWN_CLASS')
+        directory = QFileDialog.getExistingDirectory(self, 'Pilih Folder yang Dipantau')
+        if directory:
+            self.watchFolder(directory, model_name_prefix)
 
-            result_text = "UNKNOWN PREDICTION"
+    def watchFolder(self, directory, model_name_prefix):
+        """Queue new images of directory once their writes have finished and classify them with model_name_prefix"""
+        self.folder_scanner = hotfolder.FolderScanner(directory)
+        self.watch_model_name = model_name_prefix
+        self.folder_watcher = QFileSystemWatcher([directory], self)
+        self.folder_watcher.directoryChanged.connect(self.scheduleFolderScan)
+        self.btnWatchFolder.setText('Berhenti Pantau')
+        self.statusBar().showMessage(f'Memantau folder {directory} dengan {model_name_prefix}')
+
+    def scheduleFolderScan(self):
+        """Scan the watched folder once the settle time has passed, coalescing change events"""
+        if self.folder_scanner is not None and not self.folderScanTimer.isActive():
+            self.folderScanTimer.start(int(self.folder_scanner.settle * 1000))
+
+    def scanWatchedFolder(self):
+        """Queue the finished new files, leaving the rest in the folder while the queue is full"""
+        if self.folder_scanner is None:
+            return
             
-            if predicted_original_label == 'corn_healthy':
-                result_text = 'Daun Jagung Baik'
-            elif predicted_original_label in ['Corn_Cercospora_leaf_spot Gray_leaf_spot', 'Corn_Northern_Leaf_Blight']:
-                result_text = 'Daun Jagung Sakit'
-            elif predicted_original_label == 'Bukan_Jagung':
-                result_text = 'Bukan Daun Jagung'
+        ready = self.folder_scanner.scan()
+        room = hotfolder.HOTFOLDER_MAX_PENDING - self.queue_counts['pending'] - self.queue_counts['running']
+        accepted = ready[:max(0, room)]
+        if accepted:
+            if not self.isQueueRunning():
+                self._pruneQueue()
+            self.folder_scanner.accept(accepted)
+            self.enqueueImages(accepted)
+            self.startQueue()
+        if self.folder_scanner is not None and self.folder_scanner.hasCandidates():
+            self.scheduleFolderScan()
+
+    def _setQueueStatus(self, row, status, text):
+        """Update the status and label of a queue item"""
+        item = self.queueList.item(row)
+        previous = item.data(Qt.UserRole + 1)
+        if previous is not None:
+            self.queue_counts[previous] -= 1
+        self.queue_counts[status] += 1
+        item.setData(Qt.UserRole + 1, status)
+        item.setText(f'{os.path.basename(item.data(Qt.UserRole))} - {text}')
+
+    def _pruneQueue(self):
+        """Drop the oldest done and failed items beyond QUEUE_MAX_FINISHED
+
+        Only called between worker runs, since a running worker refers to
+        queue items by row.
+        """
+        excess = self.queue_counts['done'] + self.queue_counts['failed'] - QUEUE_MAX_FINISHED
+        row = 0
+        while excess > 0 and row < self.queueList.count():
+            status = self.queueList.item(row).data(Qt.UserRole + 1)
+            if status in ('done', 'failed'):
+                self.queueList.takeItem(row)
+                self.queue_counts[status] -= 1
+                excess -= 1
             else:
-                result_text = f'Hasil Tidak Dikenal ({predicted_original_label})' 
-       
-            self.resultLabel.setText(result_text)
-            self.confidenceLabel.setText(f'{confidence:.2%}')
-            self.processingTimeLabel.setText(f'{processing_time:.3f} detik')
+                row += 1
+
+    def _queueRows(self, statuses):
+        """Return queue rows whose status is in statuses"""
+        return [row for row in range(self.queueList.count())
+                if self.queueList.item(row).data(Qt.UserRole + 1) in statuses]
+
+    def isQueueRunning(self):
+        """Check whether the background prediction worker is busy or has results pending"""
+        return self.prediction_worker is not None
+
+    def updateQueueButtons(self):
+        """Enable queue buttons according to the queue state"""
+        running = self.isQueueRunning()
+        self.btnStartQueue.setEnabled(not running and self.queue_counts['pending'] + self.queue_counts['cancelled'] > 0)
+        self.btnCancelQueue.setEnabled(running)
+        self.btnClearQueue.setEnabled(not running and self.queueList.count() > 0)
+
+    def startQueue(self):
+        """Process pending queue items on a background thread"""
+        if self.isQueueRunning():
+            return
             
-            self.saveToDatabase(
-                os.path.basename(self.current_image_path),
-                result_text,
-                model_name_prefix,
-                confidence
-            )
+        model_name_prefix = self.queueModelName()
+        
+        if not self.checkModelAvailable(model_name_prefix):
+            if self.folder_scanner is not None:
+                self.toggleWatchFolder()
+            return
             
-            self.statusBar().showMessage(f'Prediksi selesai: {result_text} ({confidence:.2%})')
+        rows = self._queueRows(('pending', 'cancelled'))
+        if not rows:
+            return
             
-        except Exception as e:
-            QMessageBox.critical(self, 'Error', f'Terjadi kesalahan saat prediksi:\n{str(e)}')
-            self.statusBar().showMessage('Prediksi gagal')
+        jobs = []
+        for row in rows:
+            self._setQueueStatus(row, 'pending', 'Menunggu')
+            jobs.append((row, self.queueList.item(row).data(Qt.UserRole)))
+        
+        batch_size = hotfolder.HOTFOLDER_BATCH_SIZE if self.folder_scanner is not None else 1
+        self.prediction_worker = PredictionWorker(jobs, self.engine, model_name_prefix, self, batch_size)
+        self.prediction_worker.itemStarted.connect(self.onQueueItemStarted)
+        self.prediction_worker.itemFinished.connect(self.onQueueItemFinished)
+        self.prediction_worker.itemFailed.connect(self.onQueueItemFailed)
+        self.prediction_worker.progressChanged.connect(self.onQueueProgress)
+        self.prediction_worker.finished.connect(self.onQueueFinished)
+        
+        self.queueProgress.setRange(0, len(jobs))
+        self.queueProgress.setValue(0)
+        self.prediction_worker.start()
+        
+        self.updateQueueButtons()
+        self.statusBar().showMessage(f'Memproses {len(jobs)} gambar dengan {model_name_prefix}...')
+
+    def cancelQueue(self):
+        """Stop the queue after the image currently being processed"""
+        if self.isQueueRunning():
+            self.prediction_worker.cancel()
+            self.btnCancelQueue.setEnabled(False)
+            self.statusBar().showMessage('Membatalkan antrian...')
+
+    def clearQueue(self):
+        """Remove all items from the queue"""
+        if not self.isQueueRunning():
+            self.queueList.clear()
+            self.queue_counts.clear()
+            self.queueProgress.setValue(0)
+            self.updateQueueButtons()
+
+    def updateCacheStatus(self):
+        """Show preprocessing cache and feature store hits and misses in the status bar"""
+        cache = features.preprocess_cache
+        text = f'Cache: {cache.hits} hit / {cache.misses} miss'
+        if self.feature_store is not None:
+            text += f' | Fitur: {self.feature_store.hits} hit / {self.feature_store.misses} miss'
+        self.cacheLabel.setText(text)
+
+    def onQueueItemStarted(self, row):
+        self._setQueueStatus(row, 'running', 'Memproses...')
+
+    def onQueueItemFinished(self, row, prediction, processing_time):
+        result_text = prediction.result
+        confidence = prediction.confidence
+        tags = ' [cache]' if prediction.cached else ''
+        if prediction.stage:
+            tags += f' [{prediction.stage}]'
+        self._setQueueStatus(row, 'done', f'{result_text} ({confidence:.2%}){tags}')
+        
+        self.resultLabel.setText(result_text)
+        self.confidenceLabel.setText(f'{confidence:.2%}')
+        self.processingTimeLabel.setText(f'{processing_time:.3f} detik')
+        
+        self.saveToDatabase(database.predictionRow(prediction, self.prediction_worker.model_name_prefix))
+        
+        self.statusBar().showMessage(f'Prediksi selesai: {result_text} ({confidence:.2%}){tags}')
+        self.updateCacheStatus()
+        self.updateModelStatus()
+
+    def onQueueItemFailed(self, row, message):
+        self._setQueueStatus(row, 'failed', f'Gagal: {message}')
+        self.updateCacheStatus()
+        self.statusBar().showMessage('Prediksi gagal')
+
+    def onQueueProgress(self, done, total):
+        self.queueProgress.setRange(0, total)
+        self.queueProgress.setValue(done)
+
+    def onQueueFinished(self):
+        """Clean up the worker and pick up images queued while it was running"""
+        cancelled = self.prediction_worker.cancelled
+        self.prediction_worker.deleteLater()
+        self.prediction_worker = None
+        
+        if self.folder_scanner is not None:
+            self._pruneQueue()
+        if cancelled:
+            for row in self._queueRows(('pending',)):
+                self._setQueueStatus(row, 'cancelled', 'Dibatalkan')
+            self.statusBar().showMessage('Antrian dibatalkan')
+        elif self.queue_counts['pending']:
+            self.startQueue()
             
-    def saveToDatabase(self, filename, result, model, confidence):
-        """Save prediction result to database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO predictions (filename, result, model_used, prediction_date, confidence, notes)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (filename, result, model, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), confidence, ''))
-        
-        conn.commit()
-        conn.close()
-        self.loadTableData() 
-        
-    def loadTableData(self):
-        """Load data from database to table"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM predictions ORDER BY id ASC')
-        data = cursor.fetchall()
-        
-        self.table.setRowCount(len(data))
-        
+        if self.folder_scanner is not None and self.folder_scanner.hasCandidates():
+            self.scheduleFolderScan()
+        self.updateQueueButtons()
 
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
 
-        for i, row in enumerate(data):
-            for j, value in enumerate(row):
-                if j == 5:  
-                    item = QTableWidgetItem(f'{value:.2%}' if value is not None else '-')
-                else:
-                    item = QTableWidgetItem(str(value))
-                item.setFlags(item.flags() & ~Qt.ItemIsEditable)  
-                self.table.setItem(i, j, item)
-        
-        conn.close()
+    def dropEvent(self, event):
+        """Queue images and folders dropped onto the window"""
+        local_paths = [url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile()]
+        file_paths = features.collectImages(local_paths)
+        if file_paths:
+            self.enqueueImages(file_paths)
+            event.acceptProposedAction()
+
+    def closeEvent(self, event):
+        self.folderScanTimer.stop()
+        self.filterTimer.stop()
+        if self.isQueueRunning():
+            self.prediction_worker.cancel()
+            self.prediction_worker.wait()
+        if self.filter_worker is not None:
+            self.filter_worker.wait()
+        if self.tile_worker is not None:
+            self.tile_worker.cancel()
+            self.tile_worker.wait()
+        if self.video_worker is not None:
+            self.video_worker.cancel()
+            self.video_worker.wait()
+        if self.model_loader is not None:
+            self.model_loader.wait()
+        self.engine.close()
+        if self.feature_store is not None:
+            self.feature_store.close()
+            self.history.close()
+        self.writer.close()
+        self.filter_database.close()
+        self.database.close()
+        event.accept()
+
+    def saveToDatabase(self, row):
+        """Queue a prediction result for the background database writer"""
+        self.writer.submit([row], self.write_notifier.rowsWritten.emit)
+
+    def onRowsWritten(self, ids):
+        """Show the rows the writer has committed once the table has paged up to them"""
+        if ids is None:
+            self.statusBar().showMessage('Gagal menyimpan hasil prediksi ke database')
+            return
+            
+        for i in self.table_model.fetchNew():
+            self.fitTableColumns(i)
+            
+    def fitTableColumns(self, i):
+        """Widen the columns that are too narrow for row i, without measuring the other rows"""
+        header = self.table.horizontalHeader()
+        metrics = self.table.fontMetrics()
+        for j in range(self.table_model.columnCount()):
+            text = self.table_model.index(i, j).data()
+            if text is None or header.sectionResizeMode(j) != QHeaderView.Interactive:
+                continue
+            width = metrics.horizontalAdvance(text) + TABLE_CELL_PADDING
+            if width > self.table.columnWidth(j):
+                self.table.setColumnWidth(j, width)
         
+    def loadTableData(self):
+        """Page the table in again from the database; only the first rows are read now"""
+        self.table_model.reload()
         self.table.resizeColumnsToContents()
-        
-        self.table.updateGeometry() 
-        self.table.viewport().update()
             
     def filterResults(self):
-        """Filter table results based on search and filter criteria"""
-        search_text = self.searchInput.text().lower()
-        filter_text = self.filterCombo.currentText()
-        
-        for i in range(self.table.rowCount()):
-            show_row = True
-            
-            filename_item = self.table.item(i, 1)
-            if filename_item and search_text:
-                filename = filename_item.text().lower()
-                if search_text not in filename:
-                    show_row = False
-            
-            result_item = self.table.item(i, 2)
-            if result_item and filter_text != 'Semua':
-                result = result_item.text()
-                if result != filter_text: 
-                    show_row = False
+        """Query the rows matching the search text and class filter in the background"""
+        self.filterTimer.stop()
+        if self.filter_worker is not None:
+            self.filter_pending = True
+            return
             
-            self.table.setRowHidden(i, not show_row)
+        filter_text = self.filterCombo.currentText()
+        self.filter_worker = FilterWorker(self.filter_database, self.searchInput.text(),
+                                          None if filter_text == 'Semua' else filter_text, TABLE_PAGE_SIZE, self)
+        self.filter_worker.filterFinished.connect(self.onFilterFinished)
+        self.filter_worker.finished.connect(self.onFilterWorkerFinished)
+        self.filter_worker.start()
+        
+    def onFilterFinished(self, search, result, ids, elapsed):
+        if self.filter_pending:
+            return
+        self.table_model.setFilter(search, result, ids)
+        print(f"Filter '{search}' / {result or 'Semua'}: {len(ids)} rows in {elapsed * 1000:.1f} ms")
+        
+    def onFilterWorkerFinished(self):
+        self.filter_worker.deleteLater()
+        self.filter_worker = None
+        if self.filter_pending:
+            self.filter_pending = False
+            self.filterResults()
             
     def deleteRecord(self):
         """Delete selected record from database"""
-        current_row = self.table.currentRow()
+        current_row = self.table.currentIndex().row()
         if current_row < 0:
             QMessageBox.warning(self, 'Warning', 'Pilih baris yang akan dihapus!')
             return
@@ -391,20 +728,12 @@ class CornDetectionApp(QMainWindow):
                                      QMessageBox.Yes | QMessageBox.No)
         
         if reply == QMessageBox.Yes:
-            record_id_item = self.table.item(current_row, 0)
-            if record_id_item:
-                record_id = record_id_item.text()
-                
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute('DELETE FROM predictions WHERE id = ?', (record_id,))
-                conn.commit()
-                conn.close()
-                
-                self.loadTableData()
-                self.statusBar().showMessage('Record berhasil dihapus')
-            else:
-                QMessageBox.warning(self, 'Error', 'Tidak dapat mengambil ID record.')
+            record_id = self.table_model.idAt(current_row)
+            
+            self.database.delete(record_id)
+            
+            self.table_model.removeRow(current_row)
+            self.statusBar().showMessage('Record berhasil dihapus')
                 
     def exportToCSV(self):
         """Export data to CSV file"""
@@ -415,10 +744,9 @@ class CornDetectionApp(QMainWindow):
         
         if file_path:
             try:
-                conn = sqlite3.connect(self.db_path)
-                df = pd.read_sql_query('SELECT * FROM predictions', conn)
+                columns, data = self.database.fetchAll()
+                df = pd.DataFrame(data, columns=columns)
                 df.to_csv(file_path, index=False)
-                conn.close()
                 
                 QMessageBox.information(self, 'Success', f'Data berhasil diekspor ke:\n{file_path}')
                 self.statusBar().showMessage('Export CSV berhasil')
@@ -435,11 +763,7 @@ class CornDetectionApp(QMainWindow):
         
         if file_path:
             try:
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM predictions ORDER BY id DESC')
-                data = cursor.fetchall()
-                conn.close()
+                _, data = self.database.fetchAll(descending=True)
                 
                 doc = SimpleDocTemplate(file_path, pagesize=letter)
                 elements = []
@@ -499,6 +823,7 @@ class CornDetectionApp(QMainWindow):
                             <li>COLOR + Random Forest (82.47%)</li>
                             <li>LBP + Random Forest (77.31%)</li>
                             <li>GLCM + Random Forest (73.25%)</li>
+                            <li>Ensemble Soft Voting (semua model)</li>
                             </ul>
                             ''')
 
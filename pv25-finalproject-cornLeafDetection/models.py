@@ -0,0 +1,110 @@
+import os
+import json
+import joblib
+
+MODEL_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+MODEL_NAMES = ['COLOR_RF', 'LBP_RF', 'GLCM_RF']
+ENSEMBLE_NAME = 'ENSEMBLE_RF'
+CASCADE_NAME = 'CASCADE_RF'
+
+# Default stage order, cheapest first by measured time per image (feature extraction and
+# predict_proba): COLOR ~0.2 ms, GLCM ~2.4 ms, LBP ~5.5 ms. Feature dimension does not
+# track cost here. tune_cascade.py measures the installed models and saves its order.
+CASCADE_ORDER = ['COLOR_RF', 'GLCM_RF', 'LBP_RF']
+CASCADE_THRESHOLDS_FILE = 'cascade_thresholds.json'
+# Used for stages and classes without a tuned threshold (see tune_cascade.py)
+DEFAULT_CASCADE_THRESHOLD = 0.9
+
+# Soft-voting weights: validation accuracy of each model (see modelCombo)
+MODEL_WEIGHTS = {
+    'COLOR_RF': 0.8247,
+    'LBP_RF': 0.7731,
+    'GLCM_RF': 0.7325
+}
+
+NON_LEAF_LABEL = 0
+PREFILTER_STAGE = 'PREFILTER'
+
+original_class_labels_map = {
+    0: 'Bukan_Jagung',
+    1: 'Corn_Cercospora_leaf_spot Gray_leaf_spot',
+    2: 'Corn_Northern_Leaf_Blight',
+    3: 'corn_healthy'
+}
+
+
+def modelPath(model_name_prefix, model_directory=MODEL_DIRECTORY):
+    """Return the .pkl path for a model name such as COLOR_RF"""
+    return os.path.join(model_directory, f"model_{model_name_prefix}.pkl")
+
+
+def modelFileVersion(model_name_prefix, model_directory=MODEL_DIRECTORY):
+    """Identity of a model file on disk (size and modification time), or None if it is missing"""
+    try:
+        stat = os.stat(modelPath(model_name_prefix, model_directory))
+    except OSError:
+        return None
+    return f'{stat.st_size}-{stat.st_mtime_ns}'
+
+
+def featureMethod(model_name_prefix):
+    """Return the feature extraction method used by a model (COLOR, LBP, GLCM)"""
+    return model_name_prefix.split('_')[0]
+
+
+def memberNames(model_name_prefix):
+    """Return the model names behind a selection; all of them for the ensemble"""
+    if model_name_prefix == ENSEMBLE_NAME:
+        return list(MODEL_NAMES)
+    if model_name_prefix == CASCADE_NAME:
+        return list(CASCADE_ORDER)
+    return [model_name_prefix]
+
+
+def cascadeThresholdsPath(model_directory=MODEL_DIRECTORY):
+    return os.path.join(model_directory, CASCADE_THRESHOLDS_FILE)
+
+
+def loadCascadeConfig(model_directory=MODEL_DIRECTORY):
+    """Return (stage order, {model name: {class label: minimum confidence}}) tuned for the cascade
+
+    Falls back to CASCADE_ORDER and no thresholds if the cascade was not
+    tuned. Files written before the order was stored hold only thresholds.
+    """
+    try:
+        with open(cascadeThresholdsPath(model_directory)) as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return list(CASCADE_ORDER), {}
+    if 'thresholds' not in config:
+        config = {'thresholds': config}
+    order = [name for name in config.get('order', CASCADE_ORDER) if name in CASCADE_ORDER]
+    thresholds = {name: {int(label): float(value) for label, value in per_class.items()}
+                  for name, per_class in config['thresholds'].items()}
+    return order, thresholds
+
+
+def saveCascadeConfig(order, thresholds, model_directory=MODEL_DIRECTORY):
+    with open(cascadeThresholdsPath(model_directory), 'w') as f:
+        json.dump({'order': list(order),
+                   'thresholds': {name: {str(label): value for label, value in per_class.items()}
+                                  for name, per_class in thresholds.items()}}, f, indent=2)
+
+
+def loadModel(model_name_prefix, model_directory=MODEL_DIRECTORY, mmap_mode='r'):
+    """Load a single model from disk, memory-mapping its numpy arrays"""
+    return joblib.load(modelPath(model_name_prefix, model_directory), mmap_mode=mmap_mode)
+
+
+def resultText(prediction_numeric):
+    """Map a numeric class prediction to the text shown to the user"""
+    predicted_original_label = original_class_labels_map.get(prediction_numeric, 'UNKNOWN_CLASS')
+
+    if predicted_original_label == 'corn_healthy':
+        return 'Daun Jagung Baik'
+    elif predicted_original_label in ['Corn_Cercospora_leaf_spot Gray_leaf_spot', 'Corn_Northern_Leaf_Blight']:
+        return 'Daun Jagung Sakit'
+    elif predicted_original_label == 'Bukan_Jagung':
+        return 'Bukan Daun Jagung'
+    return f'Hasil Tidak Dikenal ({predicted_original_label})'
+
@@ -0,0 +1,118 @@
+from array import array
+from collections import OrderedDict
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+TABLE_HEADERS = ['ID', 'Nama File', 'Hasil Prediksi', 'Model', 'Tanggal', 'Confidence']
+CONFIDENCE_COLUMN = 5
+TABLE_PAGE_SIZE = 256
+TABLE_CACHED_PAGES = 64
+
+
+class PredictionTableModel(QAbstractTableModel):
+    """Prediction history paged in from a PredictionDatabase as the view scrolls
+
+    fetchMore only adds the ids of the next TABLE_PAGE_SIZE matching rows,
+    8 bytes each. The column values are read a page at a time when data()
+    first needs them and kept for the TABLE_CACHED_PAGES pages used last,
+    so memory stays bounded however many rows the table has.
+    """
+
+    def __init__(self, prediction_database, parent=None):
+        super().__init__(parent)
+        self.database = prediction_database
+        self.ids = array('q')
+        self.pages = OrderedDict()
+        self.exhausted = False
+        self.search = ''
+        self.result = None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.ids)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(TABLE_HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return TABLE_HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        row = self.rowValues(index.row())
+        if row is None:
+            return None
+        value = row[index.column()]
+        if index.column() == CONFIDENCE_COLUMN:
+            return f'{value:.2%}' if value is not None else '-'
+        return str(value)
+
+    def rowValues(self, i):
+        """Return the HISTORY_COLUMNS of row i, reading its page if it is not cached"""
+        page = i // TABLE_PAGE_SIZE
+        values = self.pages.get(page)
+        if values is None or self.ids[i] not in values:
+            values = self.database.fetchColumns(self.ids[page * TABLE_PAGE_SIZE:(page + 1) * TABLE_PAGE_SIZE])
+            self.pages[page] = values
+            if len(self.pages) > TABLE_CACHED_PAGES:
+                self.pages.popitem(last=False)
+        self.pages.move_to_end(page)
+        return values.get(self.ids[i])
+
+    def idAt(self, i):
+        return self.ids[i]
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        ids = self.database.pageIds(self.ids[-1] if self.ids else 0, TABLE_PAGE_SIZE, self.search, self.result)
+        self.exhausted = len(ids) < TABLE_PAGE_SIZE
+        if ids:
+            self.beginInsertRows(QModelIndex(), len(self.ids), len(self.ids) + len(ids) - 1)
+            self.ids.extend(ids)
+            self.endInsertRows()
+
+    def fetchNew(self):
+        """Page in rows added after the last one loaded, if every earlier row is loaded
+
+        Otherwise they are reached by scrolling like the rest. Returns the
+        range of rows that were added.
+        """
+        first = len(self.ids)
+        if self.exhausted:
+            self.exhausted = False
+            self.fetchMore()
+        return range(first, len(self.ids))
+
+    def removeRows(self, row, count, parent=QModelIndex()):
+        if parent.isValid() or row < 0 or row + count > len(self.ids):
+            return False
+        self.beginRemoveRows(parent, row, row + count - 1)
+        del self.ids[row:row + count]
+        self.pages.clear()
+        self.endRemoveRows()
+        return True
+
+    def setFilter(self, search='', result=None, first_page=None):
+        """Only show predictions whose filename contains search and whose result is result
+
+        first_page is the first TABLE_PAGE_SIZE matching ids if the caller
+        already queried them, e.g. off the GUI thread.
+        """
+        self.search = search
+        self.result = result
+        self.reload(first_page)
+
+    def reload(self, first_page=None):
+        """Drop the loaded rows and page the table in again from the first row"""
+        self.beginResetModel()
+        self.ids = array('q', first_page or ())
+        self.pages.clear()
+        self.exhausted = first_page is not None and len(first_page) < TABLE_PAGE_SIZE
+        self.endResetModel()
+        if first_page is None:
+            self.fetchMore()
@@ -0,0 +1,218 @@
+"""Tiled classification of large field and drone images.
+
+The image is read in horizontal bands of TILE_SIZE rows, each band is cut
+into TILE_SIZE x TILE_SIZE tiles and every tile is classified like a normal
+upload. TIFF files are read strip- or tile-wise with tifffile (or memory
+mapped when uncompressed), so the full raster never has to be in memory.
+Other formats cannot be decoded partially and are read whole by OpenCV.
+"""
+import os
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+import features
+import models
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+TILE_SIZE = 256
+THUMBNAIL_WIDTH = 1024
+TIFF_EXTENSIONS = ('.tif', '.tiff')
+TIFF_READ_BUFFER = 1 << 20  # compressed bytes tifffile reads ahead; its default buffers most of the file
+
+# BGR overlay colour per class label
+HEATMAP_COLORS = {
+    0: (150, 150, 150),
+    1: (0, 140, 255),
+    2: (0, 0, 220),
+    3: (0, 190, 0)
+}
+
+TileResult = namedtuple('TileResult', ['image_path', 'shape', 'labels', 'confidences', 'areas', 'area_fractions',
+                                       'thumbnail', 'complete'], defaults=(True,))
+
+
+def _toBGR(array, rgb_order=True):
+    """Convert a gray, RGB(A) or 16-bit band to uint8 BGR"""
+    if array.dtype == np.uint16:
+        array = (array >> 8).astype(np.uint8)
+    elif array.dtype != np.uint8:
+        array = cv2.normalize(array, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+
+    if array.ndim == 2 or array.shape[2] == 1:
+        return cv2.cvtColor(array, cv2.COLOR_GRAY2BGR)
+    if array.shape[2] >= 4:
+        array = array[:, :, :3]
+    return cv2.cvtColor(array, cv2.COLOR_RGB2BGR) if rgb_order else np.ascontiguousarray(array)
+
+
+def _memmapBands(image, tile):
+    for y in range(0, image.shape[0], tile):
+        yield y, _toBGR(np.asarray(image[y:y + tile]))
+
+
+def _segmentBands(page, tile):
+    """Assemble bands from the decoded strips or tiles of a TIFF page, in file order"""
+    height, width = page.shape[:2]
+    chunk_height = page.chunks[0]
+    buffer = None
+    band_start = 0
+
+    for segment, indices, _ in page.segments(buffersize=TIFF_READ_BUFFER):
+        y, x = indices[2], indices[3]
+        segment = segment[0]
+        if buffer is None:
+            buffer = np.zeros((tile + chunk_height, width) + segment.shape[2:], dtype=segment.dtype)
+
+        while y >= band_start + tile:
+            yield band_start, _toBGR(buffer[:min(tile, height - band_start)].copy())
+            buffer[:-tile] = buffer[tile:]
+            buffer[-tile:] = 0
+            band_start += tile
+
+        rows = min(segment.shape[0], height - y)
+        cols = min(segment.shape[1], width - x)
+        buffer[y - band_start:y - band_start + rows, x:x + cols] = segment[:rows, :cols]
+
+    while buffer is not None and band_start < height:
+        yield band_start, _toBGR(buffer[:min(tile, height - band_start)].copy())
+        buffer[:-tile] = buffer[tile:]
+        buffer[-tile:] = 0
+        band_start += tile
+
+
+def readBands(image_path, tile=TILE_SIZE):
+    """Return (height, width, iterator of (y, BGR band of up to tile rows))"""
+    if tifffile is not None and image_path.lower().endswith(TIFF_EXTENSIONS):
+        with tifffile.TiffFile(image_path) as tif:
+            page = tif.pages[0]
+            shape = page.shape
+            memmappable = page.is_memmappable
+            chunked = page.planarconfig == 1 and len(page.chunks) == len(shape)
+
+        if memmappable:
+            image = tifffile.memmap(image_path, page=0, mode='r')
+            return shape[0], shape[1], _memmapBands(image, tile)
+        if chunked:
+            def bands():
+                with tifffile.TiffFile(image_path) as tif:
+                    yield from _segmentBands(tif.pages[0], tile)
+            return shape[0], shape[1], bands()
+
+    image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError(f"Cannot load image from {image_path}. Check file path and integrity.")
+    image = _toBGR(image, rgb_order=False)
+    return image.shape[0], image.shape[1], ((y, image[y:y + tile]) for y in range(0, image.shape[0], tile))
+
+
+def _classifyBand(engine, band, model_name_prefix, tile):
+    """Classify the tiles of one band; returns per-tile labels, confidences and pixel areas"""
+    tiles = [band[:, x:x + tile] for x in range(0, band.shape[1], tile)]
+    images = [features.PreprocessedImage(cv2.resize(tile_bgr, features.IMAGE_SIZE)) for tile_bgr in tiles]
+    predictions = engine.predictImages(images, model_name_prefix)
+    labels = np.array([prediction.label for prediction in predictions])
+    confidences = np.array([prediction.confidence for prediction in predictions])
+    areas = np.array([tile_bgr.shape[0] * tile_bgr.shape[1] for tile_bgr in tiles])
+    return labels, confidences, areas
+
+
+def classifyTiles(engine, image_path, model_name_prefix, workers=None, tile=TILE_SIZE, progress=None,
+                  cancelled=None):
+    """Classify every tile of a large image, a few bands in parallel
+
+    progress(done_bands, total_bands) is called after each band; when
+    cancelled() returns True no further bands are read. Returns a TileResult
+    with the label and confidence grids, the share of the image area given
+    to each class and a thumbnail for drawing the heatmap. After a cancel
+    it covers only the bands read from the top, its shape is that strip
+    and complete is False.
+    """
+    height, width, bands = readBands(image_path, tile)
+    total_bands = -(-height // tile)
+    scale = min(1.0, THUMBNAIL_WIDTH / width)
+    thumbnail_width = max(1, round(width * scale))
+    workers = workers or min(4, os.cpu_count() or 1)
+
+    rows = [None] * total_bands
+    thumbnail_bands = []
+    pending = deque()
+    done = 0
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tiles') as executor:
+        def collect():
+            nonlocal done
+            index, future = pending.popleft()
+            rows[index] = future.result()
+            done += 1
+            if progress is not None:
+                progress(done, total_bands)
+
+        for y, band in bands:
+            if cancelled is not None and cancelled():
+                break
+            thumbnail_size = (thumbnail_width, max(1, round(band.shape[0] * scale)))
+            thumbnail_bands.append(cv2.resize(band, thumbnail_size, interpolation=cv2.INTER_AREA))
+            pending.append((y // tile, executor.submit(_classifyBand, engine, band, model_name_prefix, tile)))
+            if len(pending) >= 2 * workers:
+                collect()
+        while pending:
+            collect()
+
+    rows = [row for row in rows if row is not None]
+    if not rows:
+        raise ValueError(f"Tidak ada ubin yang diklasifikasikan untuk {image_path}.")
+    # Bands are read top to bottom and every submitted one is collected, so rows is a prefix
+    complete = len(rows) == total_bands
+    covered_height = height if complete else len(rows) * tile
+
+    labels = np.vstack([row[0] for row in rows])
+    confidences = np.vstack([row[1] for row in rows])
+    areas = np.vstack([row[2] for row in rows])
+    area_fractions = {
+        models.original_class_labels_map.get(label.item(), str(label)): float(areas[labels == label].sum() / areas.sum())
+        for label in np.unique(labels)
+    }
+    return TileResult(image_path, (covered_height, width), labels, confidences, areas, area_fractions,
+                      np.vstack(thumbnail_bands), complete)
+
+
+def dominantResult(result):
+    """Return (label, result text, confidence) of the class covering the largest area
+
+    The confidence is the mean confidence of the tiles given that class.
+    """
+    labels = np.unique(result.labels)
+    label = labels[np.argmax([result.areas[result.labels == label].sum() for label in labels])]
+    return label.item(), models.resultText(label.item()), float(result.confidences[result.labels == label].mean())
+
+
+def heatmapOverlay(result, alpha=0.45):
+    """Draw the tile classes over the thumbnail, returning a BGR image"""
+    thumbnail = result.thumbnail
+    tile_rows, tile_cols = result.labels.shape
+    scale_y = thumbnail.shape[0] / result.shape[0]
+    scale_x = thumbnail.shape[1] / result.shape[1]
+
+    colors = np.zeros_like(thumbnail)
+    for row in range(tile_rows):
+        for col in range(tile_cols):
+            top, left = round(row * TILE_SIZE * scale_y), round(col * TILE_SIZE * scale_x)
+            bottom = round(min((row + 1) * TILE_SIZE, result.shape[0]) * scale_y)
+            right = round(min((col + 1) * TILE_SIZE, result.shape[1]) * scale_x)
+            colors[top:bottom, left:right] = HEATMAP_COLORS.get(result.labels[row, col], (255, 255, 255))
+
+    overlay = cv2.addWeighted(thumbnail, 1 - alpha, colors, alpha, 0)
+    grid_color = (255, 255, 255)
+    for row in range(1, tile_rows):
+        y = round(row * TILE_SIZE * scale_y)
+        cv2.line(overlay, (0, y), (overlay.shape[1] - 1, y), grid_color, 1)
+    for col in range(1, tile_cols):
+        x = round(col * TILE_SIZE * scale_x)
+        cv2.line(overlay, (x, 0), (x, overlay.shape[0] - 1), grid_color, 1)
+    return overlay
@@ -0,0 +1,180 @@
+"""Tune the per-class confidence thresholds of the CASCADE_RF mode.
+
+The labelled images are expected in one folder per class, named like the
+classes in models.original_class_labels_map (e.g. corn_healthy) or by the
+numeric label:
+
+    python tune_cascade.py dataset/ --precision 0.95
+    python tune_cascade.py dataset/ --order GLCM_RF LBP_RF COLOR_RF
+
+The stages are ordered by their measured time per image, cheapest first,
+unless --order is given. The thresholds are tuned on part of the images
+and the accuracy, which stage answered and the mean latency against every
+single model are reported on the held-out rest. Writes the order and the
+thresholds to cascade_thresholds.json next to the models.
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+import features
+import models
+from engine import PredictionEngine, BACKENDS
+
+UNREACHABLE_THRESHOLD = 1.01  # a stage answers this class only when no stage is confident enough
+
+
+def labelledImages(dataset_directory):
+    """Return (paths, labels) for the images in the class folders of a dataset"""
+    label_by_name = {name: label for label, name in models.original_class_labels_map.items()}
+    image_paths = []
+    labels = []
+    for folder in sorted(os.listdir(dataset_directory)):
+        folder_path = os.path.join(dataset_directory, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        if folder in label_by_name:
+            label = label_by_name[folder]
+        elif folder.isdigit():
+            label = int(folder)
+        else:
+            print(f"Skipping folder with unknown class: {folder}", file=sys.stderr)
+            continue
+        for image_path in features.collectImages([folder_path]):
+            image_paths.append(image_path)
+            labels.append(label)
+    return image_paths, np.array(labels)
+
+
+def classThresholds(proba, classes, labels, precision):
+    """Lowest confidence per predicted class at which the accepted answers reach the target precision"""
+    best = proba.argmax(axis=1)
+    confidence = proba[np.arange(len(proba)), best]
+    thresholds = {}
+    for column, label in enumerate(classes):
+        predicted = np.flatnonzero(best == column)
+        if not len(predicted):
+            continue
+        order = predicted[np.argsort(-confidence[predicted], kind='stable')]
+        correct = np.cumsum(labels[order] == label)
+        reached = np.flatnonzero(correct / np.arange(1, len(order) + 1) >= precision)
+        thresholds[label.item()] = float(confidence[order[reached[-1]]]) if len(reached) else UNREACHABLE_THRESHOLD
+    return thresholds
+
+
+def splitHoldout(labels, fraction, seed=0):
+    """Return (tuning indices, held-out indices), holding out about fraction of each class"""
+    rng = np.random.default_rng(seed)
+    tuning = []
+    held_out = []
+    for label in np.unique(labels):
+        indices = rng.permutation(np.flatnonzero(labels == label))
+        count = int(round(len(indices) * fraction))
+        held_out.extend(indices[:count])
+        tuning.extend(indices[count:])
+    return np.sort(tuning), np.sort(held_out)
+
+
+def stageCosts(engine, images, names):
+    """Mean seconds per image of each stage: feature extraction and predict_proba, one image at a time"""
+    members = engine.members(models.CASCADE_NAME)
+    costs = {}
+    for name in names:
+        model = members[name]
+        if engine.backend == 'compiled':
+            model = engine.compiledModel(name, model)
+        method = models.featureMethod(name)
+        start_time = time.perf_counter()
+        for image in images:
+            model.predict_proba(features.featureMatrix([image], method))
+        costs[name] = (time.perf_counter() - start_time) / len(images)
+    return costs
+
+
+def tuneThresholds(engine, images, labels, precision, order):
+    """Return {stage: {class label: threshold}} for every cascade stage in order"""
+    members = engine.members(models.CASCADE_NAME)
+    names = [name for name in order if name in members]
+    thresholds = {}
+    for name in names:
+        model = members[name]
+        proba = model.predict_proba(features.featureMatrix(images, models.featureMethod(name)))
+        thresholds[name] = classThresholds(proba, model.classes_, labels, precision)
+    return thresholds
+
+
+def meanLatency(engine, image_paths, model_name_prefix):
+    """Classify the images one by one; return the predictions and the mean seconds per image"""
+    predictions = []
+    start_time = time.perf_counter()
+    for image_path in image_paths:
+        predictions.extend(engine.predict_batch([image_path], model_name_prefix))
+    return predictions, (time.perf_counter() - start_time) / len(image_paths)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tune the confidence thresholds of the model cascade.')
+    parser.add_argument('dataset', help='folder with one sub-folder of images per class')
+    parser.add_argument('--precision', type=float, default=0.95,
+                        help='precision an early stage must reach on the answers it accepts (default 0.95)')
+    parser.add_argument('--models', default=models.MODEL_DIRECTORY, help='folder with the model_*.pkl files')
+    parser.add_argument('--backend', default='sklearn', choices=BACKENDS, help='forest inference backend for the timing')
+    parser.add_argument('--order', nargs='+', choices=models.CASCADE_ORDER,
+                        help='stage order to use instead of ordering by measured cost')
+    parser.add_argument('--holdout', type=float, default=0.3,
+                        help='share of each class held out to report accuracy and latency (default 0.3)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the held-out split')
+    parser.add_argument('--dry-run', action='store_true', help='report without writing the thresholds file')
+    args = parser.parse_args(argv)
+
+    image_paths, labels = labelledImages(args.dataset)
+    if not image_paths:
+        print('No labelled images found.')
+        return 1
+
+    tuning, held_out = splitHoldout(labels, args.holdout, args.seed)
+    if not len(tuning) or not len(held_out):
+        print(f"Too few images to hold out {args.holdout:.0%} of them.")
+        return 1
+
+    engine = PredictionEngine(args.models, args.backend)
+    available = engine.members(models.CASCADE_NAME)
+    names = [name for name in (args.order or models.CASCADE_ORDER) if name in available]
+    if len(names) < 2:
+        print(f"The cascade needs at least two models, found: {', '.join(names) or 'none'}")
+        return 1
+
+    images = [features.preprocessImage(image_paths[i]) for i in tuning]
+    costs = stageCosts(engine, images, names)
+    if not args.order:
+        names.sort(key=costs.get)
+    print('order', ' -> '.join(f'{name} ({costs[name] * 1000:.2f} ms)' for name in names))
+
+    engine.cascade_order = names
+    engine.cascade_thresholds = tuneThresholds(engine, images, labels[tuning], args.precision, names)
+    for name, per_class in engine.cascade_thresholds.items():
+        print(name, ', '.join(f'{models.original_class_labels_map.get(label, label)}: {threshold:.3f}'
+                              for label, threshold in sorted(per_class.items())))
+
+    test_paths = [image_paths[i] for i in held_out]
+    test_labels = labels[held_out]
+    print(f"{len(tuning)} images tuned, {len(held_out)} held out:")
+    cascade, cascade_latency = meanLatency(engine, test_paths, models.CASCADE_NAME)
+    for name in names:
+        answered = sum(prediction.stage == name for prediction in cascade)
+        print(f"  answered by {name:<9} {answered:6d} ({answered / len(cascade):.1%})")
+    for name, predictions, latency in [(models.CASCADE_NAME, cascade, cascade_latency)] + \
+            [(name, *meanLatency(engine, test_paths, name)) for name in names]:
+        accuracy = np.mean([prediction.label for prediction in predictions] == test_labels)
+        print(f"{name}: accuracy {accuracy:.4f}, {latency * 1000:.2f} ms/image")
+
+    if not args.dry_run:
+        models.saveCascadeConfig(names, engine.cascade_thresholds, args.models)
+        print(f"Saved {models.cascadeThresholdsPath(args.models)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""Classification of walk-through videos of corn plots.
+
+Usage:
+    python video.py plot.mp4 --model COLOR_RF
+    python video.py plot.mp4 --window 1.0 --min-change 2 --db corn.db
+
+A decoder thread reads frames with cv2.VideoCapture and drops frames that
+barely differ from the last sampled one, while the calling thread
+classifies the sampled frames in small batches. The labels are smoothed
+with a confidence-weighted vote over a sliding window of video time, so
+frames skipped in a still scene do not widen it, and runs of the same
+smoothed label are reported as segments.
+"""
+import os
+import sys
+import time
+import queue
+import argparse
+import threading
+from collections import namedtuple, defaultdict
+import cv2
+
+import features
+import models
+import database
+from engine import PredictionEngine, BACKENDS
+
+FRAME_DIFF_SIZE = (32, 32)
+MIN_FRAME_CHANGE = 4.0  # mean absolute gray level difference to the last sampled frame
+MAX_FRAME_SKIP = 30  # sample at least every n-th frame, even of a still scene
+SMOOTHING_WINDOW = 0.5  # seconds of video around each sampled frame that vote on its label
+VIDEO_BATCH_SIZE = 8
+FRAME_QUEUE_SIZE = 32
+DEFAULT_VIDEO_FPS = 25.0
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+VIDEO_STAGE = 'VIDEO'
+
+VideoSegment = namedtuple('VideoSegment', ['start', 'end', 'label', 'result', 'confidence', 'frames'])
+VideoResult = namedtuple('VideoResult', ['video_path', 'segments', 'frames_read', 'frames_classified', 'elapsed'])
+
+
+def _decodeFrames(capture, frames, stop, counts, min_change, max_skip):
+    """Read frames into the queue as (frame index, PreprocessedImage), skipping near-identical ones"""
+    previous = None
+    skipped = 0
+    try:
+        while not stop.is_set():
+            ok, frame = capture.read()
+            if not ok:
+                break
+            index = counts['read']
+            counts['read'] += 1
+
+            image = features.PreprocessedImage(cv2.resize(frame, features.IMAGE_SIZE))
+            small = cv2.resize(image.gray, FRAME_DIFF_SIZE, interpolation=cv2.INTER_AREA)
+            if previous is not None and skipped < max_skip and \
+                    cv2.norm(small, previous, cv2.NORM_L1) / small.size < min_change:
+                skipped += 1
+                continue
+
+            previous = small
+            skipped = 0
+            while not stop.is_set():
+                try:
+                    frames.put((index, image), timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+    finally:
+        frames.put(None)
+
+
+def smoothLabels(indices, labels, confidences, half_window):
+    """Replace each label by the confidence-weighted majority of the sampled frames near it
+
+    Frames vote when their source frame index is at most half_window frames
+    from the frame being smoothed, however many frames were skipped between.
+    """
+    smoothed = []
+    first = last = 0
+    for i, label in enumerate(labels):
+        while indices[first] < indices[i] - half_window:
+            first += 1
+        while last < len(labels) and indices[last] <= indices[i] + half_window:
+            last += 1
+        scores = defaultdict(float)
+        for j in range(first, last):
+            scores[labels[j]] += confidences[j]
+        best = max(scores.values())
+        smoothed.append(label if scores[label] == best else max(scores, key=scores.get))
+    return smoothed
+
+
+def segmentLabels(indices, labels, confidences, smoothed, fps, frame_count):
+    """Group runs of the same smoothed result into VideoSegments with times in seconds
+
+    Disease classes share one result text, so a run may mix their labels;
+    the segment takes the most frequent one. A segment lasts until the next
+    sampled frame with a different result and its confidence is the mean of
+    the frames whose own result agrees with it.
+    """
+    results = [models.resultText(label) for label in smoothed]
+    segments = []
+    start = 0
+    for i in range(1, len(results) + 1):
+        if i < len(results) and results[i] == results[start]:
+            continue
+        run = smoothed[start:i]
+        agreeing = [confidences[j] for j in range(start, i) if models.resultText(labels[j]) == results[start]]
+        end_frame = indices[i] if i < len(results) else frame_count
+        segments.append(VideoSegment(indices[start] / fps, end_frame / fps, max(set(run), key=run.count),
+                                     results[start], sum(agreeing) / len(agreeing) if agreeing else 0.0, i - start))
+        start = i
+    return segments
+
+
+def classifyVideo(engine, video_path, model_name_prefix, window=SMOOTHING_WINDOW, min_change=MIN_FRAME_CHANGE,
+                  max_skip=MAX_FRAME_SKIP, batch_size=VIDEO_BATCH_SIZE, progress=None, cancelled=None):
+    """Classify the frames of a video file and return a VideoResult with its segments
+
+    progress(frames_read, frame_count) is called after each classified
+    batch (frame_count is 0 if the container does not report it); when
+    cancelled() returns True decoding stops and the frames read so far are
+    segmented. window is the length of the smoothing window in seconds.
+    """
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video {video_path}. Check file path and codec.")
+    fps = capture.get(cv2.CAP_PROP_FPS) or DEFAULT_VIDEO_FPS
+    frame_count = max(0, int(capture.get(cv2.CAP_PROP_FRAME_COUNT)))
+
+    frames = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    stop = threading.Event()
+    counts = {'read': 0}
+    decoder = threading.Thread(target=_decodeFrames, args=(capture, frames, stop, counts, min_change, max_skip),
+                               name='video-decoder', daemon=True)
+
+    indices = []
+    labels = []
+    confidences = []
+    batch = []
+
+    def classifyBatch():
+        predictions = engine.predictImages([image for _, image in batch], model_name_prefix)
+        for (index, _), prediction in zip(batch, predictions):
+            indices.append(index)
+            labels.append(prediction.label)
+            confidences.append(prediction.confidence)
+        batch.clear()
+        if progress is not None:
+            progress(counts['read'], frame_count)
+
+    start_time = time.perf_counter()
+    decoder.start()
+    try:
+        while True:
+            if cancelled is not None and cancelled():
+                stop.set()
+            item = frames.get()
+            if item is None:
+                break
+            batch.append(item)
+            if len(batch) >= batch_size or frames.empty():
+                classifyBatch()
+        if batch:
+            classifyBatch()
+    finally:
+        stop.set()
+        while decoder.is_alive():
+            try:
+                frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        capture.release()
+    elapsed = time.perf_counter() - start_time
+
+    if not labels:
+        raise ValueError(f"Tidak ada frame yang dapat dibaca dari {video_path}.")
+
+    smoothed = smoothLabels(indices, labels, confidences, window * fps / 2)
+    segments = segmentLabels(indices, labels, confidences, smoothed, fps, max(frame_count, counts['read']))
+    return VideoResult(video_path, segments, counts['read'], len(labels), elapsed)
+
+
+def formatTime(seconds):
+    """Format seconds as m:ss.s"""
+    minutes, seconds = divmod(seconds, 60)
+    return f'{int(minutes)}:{seconds:04.1f}'
+
+
+def segmentRows(result, model_name_prefix):
+    """Rows for database.insertPredictions, one per segment"""
+    return [{
+        'filename': os.path.basename(result.video_path),
+        'result': segment.result,
+        'model_used': model_name_prefix,
+        'confidence': segment.confidence,
+        'stage': VIDEO_STAGE,
+        'notes': f'{formatTime(segment.start)}-{formatTime(segment.end)}, {segment.frames} frame'
+    } for segment in result.segments]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Classify a walk-through video of a corn plot.')
+    parser.add_argument('video', help='video file readable by OpenCV')
+    parser.add_argument('--model', default='COLOR_RF',
+                        choices=models.MODEL_NAMES + [models.ENSEMBLE_NAME, models.CASCADE_NAME])
+    parser.add_argument('--backend', default='sklearn', choices=BACKENDS, help='forest inference backend')
+    parser.add_argument('--window', type=float, default=SMOOTHING_WINDOW,
+                        help=f'seconds of video in the smoothing window (default {SMOOTHING_WINDOW}, 0: off)')
+    parser.add_argument('--min-change', type=float, default=MIN_FRAME_CHANGE,
+                        help='skip frames whose mean gray level differs less than this from the last sampled '
+                             f'frame (default {MIN_FRAME_CHANGE}, 0: classify every frame)')
+    parser.add_argument('--max-skip', type=int, default=MAX_FRAME_SKIP,
+                        help=f'classify at least every n-th frame (default {MAX_FRAME_SKIP})')
+    parser.add_argument('--db', help='also store one row per segment in this SQLite database')
+    args = parser.parse_args(argv)
+
+    if not any(os.path.exists(models.modelPath(name)) for name in models.memberNames(args.model)):
+        parser.error(f"model file not found for {args.model} in {models.MODEL_DIRECTORY}")
+
+    engine = PredictionEngine(models.MODEL_DIRECTORY, args.backend, min_vegetation=features.PREFILTER_MIN_COVERAGE)
+    for name, error in engine.loadAvailable(models.memberNames(args.model)).items():
+        print(f"Error loading {name}: {error}", file=sys.stderr)
+
+    try:
+        result = classifyVideo(engine, args.video, args.model, args.window, args.min_change, args.max_skip)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        engine.close()
+
+    print(f"{'start':>8} {'end':>8} {'frames':>6} {'confidence':>10}  result")
+    for segment in result.segments:
+        print(f"{formatTime(segment.start):>8} {formatTime(segment.end):>8} {segment.frames:>6} "
+              f"{segment.confidence:>10.2%}  {segment.result}")
+    print(f"{result.frames_read} frames read, {result.frames_classified} classified in {result.elapsed:.2f} s "
+          f"({result.frames_read / result.elapsed:.1f} frames/sec, "
+          f"{result.frames_classified / result.elapsed:.1f} classified/sec)")
+
+    if args.db:
+        conn = database.connect(args.db)
+        database.insertPredictions(conn, segmentRows(result, args.model))
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
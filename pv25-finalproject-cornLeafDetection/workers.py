@@ -0,0 +1,163 @@
+import time
+import sqlite3
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+
+import features
+import models
+import tiles
+import video
+from engine import Prediction
+
+
+class PredictionWorker(QThread):
+    """Classify a list of queued images off the GUI thread
+
+    Images are classified batch_size at a time with one predict_batch call;
+    the processing time reported per image is its share of the batch.
+    """
+    itemStarted = pyqtSignal(int)
+    itemFinished = pyqtSignal(int, object, float)
+    itemFailed = pyqtSignal(int, str)
+    progressChanged = pyqtSignal(int, int)
+
+    def __init__(self, jobs, engine, model_name_prefix, parent=None, batch_size=1):
+        super().__init__(parent)
+        self.jobs = jobs
+        self.engine = engine
+        self.model_name_prefix = model_name_prefix
+        self.batch_size = max(1, batch_size)
+        self.cancelled = False
+
+    def cancel(self):
+        """Stop after the batch currently being processed"""
+        self.cancelled = True
+
+    def run(self):
+        total = len(self.jobs)
+
+        for start in range(0, total, self.batch_size):
+            if self.cancelled:
+                break
+
+            chunk = self.jobs[start:start + self.batch_size]
+            for row, _ in chunk:
+                self.itemStarted.emit(row)
+            start_time = time.perf_counter()
+            try:
+                predictions = self.engine.predict_batch([image_path for _, image_path in chunk],
+                                                        self.model_name_prefix, features.preprocess_cache)
+            except Exception as e:
+                predictions = [Prediction(image_path, None, None, None, str(e)) for _, image_path in chunk]
+            processing_time = (time.perf_counter() - start_time) / len(chunk)
+
+            for (row, image_path), prediction in zip(chunk, predictions):
+                if prediction.error is not None:
+                    print(f"Error predicting {image_path}: {prediction.error}")
+                    self.itemFailed.emit(row, prediction.error)
+                else:
+                    self.itemFinished.emit(row, prediction, processing_time)
+
+            self.progressChanged.emit(start + len(chunk), total)
+
+
+class TileWorker(QThread):
+    """Classify the tiles of one large image off the GUI thread"""
+    progressChanged = pyqtSignal(int, int)
+    tilesFinished = pyqtSignal(object, float)
+    tilesFailed = pyqtSignal(str)
+
+    def __init__(self, image_path, engine, model_name_prefix, parent=None):
+        super().__init__(parent)
+        self.image_path = image_path
+        self.engine = engine
+        self.model_name_prefix = model_name_prefix
+        self.cancelled = False
+
+    def cancel(self):
+        """Stop reading further bands of the image"""
+        self.cancelled = True
+
+    def run(self):
+        start_time = time.perf_counter()
+        try:
+            result = tiles.classifyTiles(self.engine, self.image_path, self.model_name_prefix,
+                                         progress=self.progressChanged.emit, cancelled=lambda: self.cancelled)
+            self.tilesFinished.emit(result, time.perf_counter() - start_time)
+        except Exception as e:
+            print(f"Error predicting tiles of {self.image_path}: {e}")
+            self.tilesFailed.emit(str(e))
+
+
+class VideoWorker(QThread):
+    """Classify the frames of a video file off the GUI thread"""
+    progressChanged = pyqtSignal(int, int)
+    videoFinished = pyqtSignal(object)
+    videoFailed = pyqtSignal(str)
+
+    def __init__(self, video_path, engine, model_name_prefix, parent=None):
+        super().__init__(parent)
+        self.video_path = video_path
+        self.engine = engine
+        self.model_name_prefix = model_name_prefix
+        self.cancelled = False
+
+    def cancel(self):
+        """Stop decoding and keep the segments of the frames read so far"""
+        self.cancelled = True
+
+    def run(self):
+        try:
+            result = video.classifyVideo(self.engine, self.video_path, self.model_name_prefix,
+                                         progress=self.progressChanged.emit, cancelled=lambda: self.cancelled)
+            self.videoFinished.emit(result)
+        except Exception as e:
+            print(f"Error predicting video {self.video_path}: {e}")
+            self.videoFailed.emit(str(e))
+
+
+class WriteNotifier(QObject):
+    """Carries PredictionWriter commit callbacks from the writer thread to the GUI thread"""
+    rowsWritten = pyqtSignal(object)
+
+
+class FilterWorker(QThread):
+    """Query the first page of the history rows matching a filter off the GUI thread"""
+    filterFinished = pyqtSignal(str, object, object, float)
+
+    def __init__(self, prediction_database, search, result, limit, parent=None):
+        super().__init__(parent)
+        self.database = prediction_database
+        self.search = search
+        self.result = result
+        self.limit = limit
+
+    def run(self):
+        start_time = time.perf_counter()
+        try:
+            ids = self.database.pageIds(0, self.limit, self.search, self.result)
+        except sqlite3.Error as e:
+            print(f"Error filtering history: {e}")
+            return
+        self.filterFinished.emit(self.search, self.result, ids, time.perf_counter() - start_time)
+
+
+class ModelLoader(QThread):
+    """Load and warm up the models in the background after the window is shown"""
+    modelStateChanged = pyqtSignal(str, str)
+    modelFailed = pyqtSignal(str, str)
+
+    def __init__(self, engine, parent=None):
+        super().__init__(parent)
+        self.engine = engine
+
+    def run(self):
+        for model_name_prefix in models.MODEL_NAMES:
+            if self.engine.states.get(model_name_prefix) != 'unloaded':
+                continue
+
+            self.modelStateChanged.emit(model_name_prefix, 'loading')
+            try:
+                self.engine.load(model_name_prefix)
+            except Exception as e:
+                self.modelFailed.emit(model_name_prefix, str(e))
+            self.modelStateChanged.emit(model_name_prefix, self.engine.states[model_name_prefix])